@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -33,7 +35,20 @@ assert any(app in INSTALLED_APPS for app in ['posts.apps.PostsConfig', 'posts'])
     'Пожалуйста зарегистрируйте приложение в `settings.INSTALLED_APPS`'
 )
 
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_cache(tmp_path_factory):
+    """Тесты не трогают общий файл кеша cache/default.sqlite3."""
+    from django.test.utils import override_settings
+    from core.test_runner import isolated_caches
+
+    directory = tmp_path_factory.mktemp('cache')
+    with override_settings(CACHES=isolated_caches(str(directory))):
+        yield
+
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
+    'tests.fixtures.fixture_queries',
 ]
@@ -0,0 +1,8 @@
+import pytest
+from posts.tests.query_budget import url_budget
+
+
+@pytest.fixture
+def query_budget():
+    """Контекст `with query_budget('posts:index'):` из QUERY_BUDGETS."""
+    return url_budget
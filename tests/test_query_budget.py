@@ -0,0 +1,42 @@
+import pytest
+from django.core.cache import cache
+
+from posts.models import Comment
+
+
+class TestQueryBudget:
+
+    @pytest.mark.django_db(transaction=True)
+    def test_feeds_query_budget(self, user_client, few_posts_with_group,
+                                another_few_posts_with_group_with_follower,
+                                query_budget):
+        post = few_posts_with_group
+        urls = {
+            'posts:index': '/',
+            'posts:group_list': f'/group/{post.group.slug}/',
+            'posts:profile': f'/profile/{post.author.username}/',
+            'posts:follow_index': '/follow/',
+        }
+        for url_name, url in urls.items():
+            cache.clear()
+            # первая отрисовка заполняет хранилище миниатюр sorl-thumbnail
+            user_client.get(url)
+            with query_budget(url_name):
+                response = user_client.get(url)
+            assert response.status_code == 200, (
+                f'Страница `{url}` работает неправильно'
+            )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_post_detail_query_budget(self, user_client, user, post,
+                                      query_budget):
+        Comment.objects.bulk_create(
+            Comment(post=post, author=user, text=f'Комментарий {i}')
+            for i in range(20)
+        )
+        user_client.get(f'/posts/{post.id}/')
+        with query_budget('posts:post_detail'):
+            response = user_client.get(f'/posts/{post.id}/')
+        assert response.status_code == 200, (
+            'Страница `/posts/<post_id>/` работает неправильно'
+        )
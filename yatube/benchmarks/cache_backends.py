@@ -0,0 +1,108 @@
+"""Пропускная способность бэкендов кеша при нескольких процессах.
+
+Запуск из каталога yatube/:
+
+    python benchmarks/cache_backends.py --processes 4 --ops 20000
+
+Каждый процесс выполняет смесь get/set/get_many/incr над общим набором
+ключей. Для LocMemCache у каждого процесса своя копия кеша, поэтому
+его доля попаданий показывает, что теряется без общего хранилища.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+import django  # noqa: E402
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'filebased': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'core.cache.SQLiteCache',
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=20000,
+                        help='операций на процесс')
+    parser.add_argument('--keys', type=int, default=1000)
+    return parser.parse_args()
+
+
+def make_cache(backend, location):
+    from django.core.cache.backends.base import InvalidCacheBackendError
+    from django.utils.module_loading import import_string
+
+    try:
+        backend_class = import_string(BACKENDS[backend])
+    except ImportError as error:
+        raise InvalidCacheBackendError(error)
+    return backend_class(location, {'OPTIONS': {'MAX_ENTRIES': 100000}})
+
+
+def worker(backend, location, ops, keys, seed, results):
+    django.setup()
+    cache = make_cache(backend, location)
+    rnd = random.Random(seed)
+    hits = reads = 0
+    started = time.perf_counter()
+    for _ in range(ops):
+        choice = rnd.random()
+        key = f'key{rnd.randrange(keys)}'
+        if choice < 0.7:
+            reads += 1
+            hits += cache.get(key) is not None
+        elif choice < 0.8:
+            names = [f'key{rnd.randrange(keys)}' for _ in range(10)]
+            reads += len(names)
+            hits += len(cache.get_many(names))
+        elif choice < 0.95:
+            cache.set(key, 'x' * 200)
+        else:
+            if not cache.add('counter', 0):
+                cache.incr('counter')
+    results.put((time.perf_counter() - started, hits, reads))
+
+
+def run(backend, args):
+    with tempfile.TemporaryDirectory() as directory:
+        location = (os.path.join(directory, 'cache.sqlite3')
+                    if backend == 'sqlite' else directory)
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(
+                backend, location, args.ops, args.keys, seed, results))
+            for seed in range(args.processes)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        stats = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+    hits = sum(hit for _, hit, _ in stats)
+    reads = sum(read for _, _, read in stats)
+    return args.ops * args.processes / elapsed, hits / max(reads, 1)
+
+
+def main():
+    args = parse_args()
+    print(f'{"бэкенд":<12}{"оп/с":>12}{"попадания":>12}')
+    for backend in BACKENDS:
+        throughput, hit_rate = run(backend, args)
+        print(f'{backend:<12}{throughput:>12.0f}{hit_rate:>12.1%}')
+
+
+if __name__ == '__main__':
+    main()
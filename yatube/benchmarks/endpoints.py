@@ -0,0 +1,369 @@
+"""Задержки и пропускная способность страниц posts, users и about.
+
+Запуск из каталога yatube/:
+
+    python benchmarks/endpoints.py                    # сравнить с базой
+    python benchmarks/endpoints.py --update-baseline  # записать базу
+
+Скрипт создаёт временную базу, заполняет её командой generate_dataset
+с фиксированным seed и гоняет каждый маршрут двумя способами:
+
+* в процессе — вызовом yatube.wsgi.application с собранным environ;
+  здесь же считаются SQL-запросы и выделенная память (tracemalloc,
+  отдельным проходом, чтобы не искажать время);
+* через локальный многопоточный сервер при нескольких уровнях
+  параллельности.
+
+Итог сравнивается с endpoints_baseline.json: если p95 или память
+выросли больше чем на --tolerance, а число запросов — хоть на один,
+скрипт печатает регрессии и завершается с кодом 1. Базу времени
+имеет смысл записывать на той же машине, где идёт сравнение.
+
+Маршрут, ответивший кодом 4xx или 5xx, — сразу ошибка: скрипт
+завершается с кодом 1, не сравнивая и не записывая базу.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'endpoints_baseline.json')
+DATASET = {'users': 500, 'groups': 20, 'posts': 20000, 'comments': 20000,
+           'follows': 5000, 'seed': 1}
+HOST = '127.0.0.1'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200,
+                        help='запросов на маршрут в процессе')
+    parser.add_argument('--server-requests', type=int, default=400,
+                        help='запросов на маршрут через сервер')
+    parser.add_argument('--concurrency', default='1,4,16',
+                        help='уровни параллельности через запятую')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='допустимый рост p95 и памяти')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--skip-server', action='store_true')
+    parser.add_argument('--only', help='подстрока имени маршрута')
+    return parser.parse_args()
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(share * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summary(timings):
+    return {
+        'p50': round(percentile(timings, 0.50), 3),
+        'p95': round(percentile(timings, 0.95), 3),
+        'p99': round(percentile(timings, 0.99), 3),
+    }
+
+
+def prepare(directory):
+    """Временные база, кеш и медиа; данные из generate_dataset."""
+    settings.DEBUG = False
+    settings.DATABASES['default']['NAME'] = os.path.join(
+        directory, 'bench.sqlite3')
+    settings.CACHES['default']['LOCATION'] = os.path.join(
+        directory, 'cache.sqlite3')
+    settings.MEDIA_ROOT = os.path.join(directory, 'media')
+    settings.PASSWORD_HASHERS = (
+        'django.contrib.auth.hashers.MD5PasswordHasher',)
+    django.setup()
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+    call_command('generate_dataset', images=3, verbosity=0, **DATASET)
+
+
+def endpoints():
+    """Маршруты с аргументами из сгенерированных данных.
+
+    Возвращает кортежи (имя, путь, нужна ли авторизация).
+    """
+    from django.contrib.auth.tokens import default_token_generator
+    from django.urls import reverse
+    from django.utils.encoding import force_bytes
+    from django.utils.http import urlsafe_base64_encode
+    from posts.models import Follow, Group, Post, User
+
+    viewer = Follow.objects.order_by('pk').first().user
+    author = (User.objects.filter(stats__posts_count__gt=0)
+              .order_by('-stats__followers_count').first())
+    post = Post.objects.filter(author=viewer).first() or Post.objects.first()
+    group = Group.objects.order_by('pk').first()
+    routes = (
+        ('posts:index', {}, False),
+        ('posts:group_list', {'slug': group.slug}, False),
+        ('posts:profile', {'username': author.username}, False),
+        ('posts:post_detail', {'post_id': post.pk}, False),
+        ('posts:search', {}, False),
+        ('posts:post_create', {}, True),
+        ('posts:add_comment', {'post_id': post.pk}, True),
+        ('posts:post_edit', {'post_id': post.pk}, True),
+        ('posts:follow_index', {}, True),
+        ('posts:profile_follow', {'username': author.username}, True),
+        ('posts:profile_unfollow', {'username': author.username}, True),
+        ('users:logout', {}, False),
+        ('users:login', {}, False),
+        ('users:signup', {}, False),
+        ('users:password_change_done', {}, True),
+        ('users:password_change', {}, True),
+        ('users:reset_done', {}, False),
+        ('users:reset_confirm', {
+            'uidb64': urlsafe_base64_encode(force_bytes(viewer.pk)),
+            'token': default_token_generator.make_token(viewer),
+        }, False),
+        ('users:password_reset_done', {}, False),
+        ('users:password_reset_form', {}, False),
+        ('about:author', {}, False),
+        ('about:tech', {}, False),
+    )
+    queries = {'posts:search': {'q': 'кошка'}}
+    result = []
+    for name, kwargs, auth in routes:
+        path = reverse(name, kwargs=kwargs)
+        if name in queries:
+            path += '?' + urlencode(queries[name])
+        result.append((name, path, auth))
+    return viewer, result
+
+
+def session_cookie(user):
+    from django.test import Client
+
+    client = Client()
+    client.force_login(user)
+    name = settings.SESSION_COOKIE_NAME
+    return f'{name}={client.cookies[name].value}'
+
+
+def environ(path, cookie):
+    split = urlsplit(path)
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': split.path,
+        'QUERY_STRING': split.query,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': HOST,
+        'HTTP_COOKIE': cookie or '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def call(application, path, cookie):
+    statuses = []
+    response = application(environ(path, cookie),
+                           lambda status, headers: statuses.append(status))
+    try:
+        for _ in response:
+            pass
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+    return int(statuses[0].split()[0])
+
+
+def in_process(application, path, cookie, repeat):
+    """Время, SQL-запросы и выделенная память одного маршрута."""
+    from django.db import connection
+
+    status = call(application, path, cookie)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call(application, path, cookie)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    queries = []
+    with connection.execute_wrapper(
+            lambda execute, *args: queries.append(1) or execute(*args)):
+        call(application, path, cookie)
+
+    tracemalloc.start()
+    allocations = []
+    for _ in range(min(repeat, 20)):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        call(application, path, cookie)
+        allocations.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return {'status': status, **summary(timings), 'queries': len(queries),
+            'bytes': int(statistics.median(allocations))}
+
+
+def serve(application):
+    from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                              WSGIRequestHandler)
+
+    class QuietHandler(WSGIRequestHandler):
+        def setup(self):
+            super().setup()
+            # заголовки и тело уходят разными send(): без TCP_NODELAY
+            # Nagle ждёт отложенный ACK клиента и добавляет ~40 мс
+            self.connection.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadedWSGIServer((HOST, 0), QuietHandler)
+    server.daemon_threads = True
+    server.set_app(application)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def over_server(port, path, cookie, total, concurrency):
+    """Задержки и пропускная способность через HTTP."""
+    local = threading.local()
+    headers = {'Cookie': cookie} if cookie else {}
+
+    def fetch(_):
+        if getattr(local, 'connection', None) is None:
+            local.connection = http.client.HTTPConnection(HOST, port)
+        started = time.perf_counter()
+        try:
+            local.connection.request('GET', path, headers=headers)
+            local.connection.getresponse().read()
+        except (ConnectionError, http.client.HTTPException):
+            local.connection.close()
+            local.connection = None
+            raise
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        timings = list(pool.map(fetch, range(total)))
+    elapsed = time.perf_counter() - started
+    return {**summary(timings), 'rps': round(total / elapsed, 1)}
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий относительно базы."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['status'] != previous['status']:
+            regressions.append(
+                f'{name}: код {previous["status"]} -> {current["status"]}')
+        if current['queries'] > previous['queries']:
+            regressions.append(
+                f'{name}: запросов {previous["queries"]} -> '
+                f'{current["queries"]}')
+        for metric in ('p95', 'bytes'):
+            limit = previous[metric] * (1 + tolerance)
+            if current[metric] > limit:
+                regressions.append(
+                    f'{name}: {metric} {previous[metric]} -> '
+                    f'{current[metric]} (порог {limit:.0f})'
+                    if metric == 'bytes' else
+                    f'{name}: {metric} {previous[metric]} -> '
+                    f'{current[metric]} мс (порог {limit:.3f})')
+    return regressions
+
+
+def main():
+    args = parse_args()
+    levels = [int(level) for level in args.concurrency.split(',')]
+    with tempfile.TemporaryDirectory() as directory:
+        prepare(directory)
+        from yatube.wsgi import application
+
+        viewer, routes = endpoints()
+        if args.only:
+            routes = [route for route in routes if args.only in route[0]]
+        cookie = session_cookie(viewer)
+
+        results = {}
+        print(f'{"маршрут":<30}{"код":>5}{"p50":>9}{"p95":>9}{"p99":>9}'
+              f'{"SQL":>5}{"байт":>10}')
+        for name, path, auth in routes:
+            # выход завершает сессию, поэтому он идёт без неё
+            measured = in_process(application, path,
+                                  cookie if auth else None, args.requests)
+            results[name] = measured
+            print(f'{name:<30}{measured["status"]:>5}{measured["p50"]:>9}'
+                  f'{measured["p95"]:>9}{measured["p99"]:>9}'
+                  f'{measured["queries"]:>5}{measured["bytes"]:>10}')
+
+        failed = [f'{name}: код {measured["status"]}'
+                  for name, measured in results.items()
+                  if measured['status'] >= 400]
+        if failed:
+            print('\nМаршруты отвечают ошибкой:')
+            print('\n'.join(failed))
+            sys.exit(1)
+
+        if not args.skip_server:
+            server = serve(application)
+            port = server.server_address[1]
+            print()
+            print(f'{"маршрут":<30}{"пар.":>5}{"p50":>9}{"p95":>9}'
+                  f'{"p99":>9}{"зап/с":>9}')
+            for name, path, auth in routes:
+                results[name]['server'] = {}
+                for level in levels:
+                    measured = over_server(
+                        port, path, cookie if auth else None,
+                        args.server_requests, level)
+                    results[name]['server'][str(level)] = measured
+                    print(f'{name:<30}{level:>5}{measured["p50"]:>9}'
+                          f'{measured["p95"]:>9}{measured["p99"]:>9}'
+                          f'{measured["rps"]:>9}')
+            server.shutdown()
+            server.server_close()
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as baseline:
+            json.dump(results, baseline, ensure_ascii=False, indent=2,
+                      sort_keys=True)
+        print(f'\nБаза записана в {args.baseline}')
+        return
+    if not os.path.exists(args.baseline):
+        print('\nБазы нет, запустите с --update-baseline')
+        return
+    with open(args.baseline, encoding='utf-8') as baseline:
+        regressions = compare(results, json.load(baseline), args.tolerance)
+    if regressions:
+        print('\nРегрессии:')
+        print('\n'.join(regressions))
+        sys.exit(1)
+    print('\nРегрессий нет')
+
+
+if __name__ == '__main__':
+    main()
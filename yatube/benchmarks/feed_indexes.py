@@ -0,0 +1,205 @@
+"""Замеры запросов лент до и после миграции с составными индексами.
+
+Запуск из каталога yatube/:
+
+    python benchmarks/feed_indexes.py --posts 1000000
+
+Скрипт создаёт временную базу SQLite, накатывает миграции до
+0010_post_image_variants, заполняет её синтетическими данными,
+замеряет запросы, затем применяет 0011_feed_indexes и замеряет снова.
+
+С --analyze перед замерами выполняется ANALYZE: по статистике SQLite
+может начать обходить ленту от auth_user и сортировать во временном
+B-дереве, что видно в выводе EXPLAIN QUERY PLAN.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+BEFORE = '0010_post_image_variants'
+AFTER = '0011_feed_indexes'
+CHUNK = 50000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--comments', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--groups', type=int, default=100)
+    parser.add_argument('--follows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument(
+        '--analyze', action='store_true',
+        help='собрать статистику sqlite_stat1 перед замерами')
+    return parser.parse_args()
+
+
+def insert_chunks(cursor, sql, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK:
+            cursor.executemany(sql, chunk)
+            chunk = []
+    if chunk:
+        cursor.executemany(sql, chunk)
+
+
+def fill(args):
+    from django.db import connection, transaction
+
+    rnd = random.Random(args.seed)
+    start = datetime(2020, 1, 1)
+    seconds = 365 * 24 * 3600
+
+    def stamp():
+        moment = start + timedelta(seconds=rnd.random() * seconds)
+        return moment.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        insert_chunks(
+            cursor,
+            'INSERT INTO auth_user (password, is_superuser, username, '
+            'first_name, last_name, email, is_staff, is_active, date_joined) '
+            'VALUES (%s, 0, %s, %s, %s, %s, 0, 1, %s)',
+            (('!', f'user{i}', 'Имя', f'Фамилия{i}', '', stamp())
+             for i in range(args.users)),
+        )
+        insert_chunks(
+            cursor,
+            'INSERT INTO posts_group (title, slug, description) '
+            'VALUES (%s, %s, %s)',
+            ((f'Группа {i}', f'group-{i}', '') for i in range(args.groups)),
+        )
+        insert_chunks(
+            cursor,
+            'INSERT INTO posts_post (text, pub_date, author_id, group_id, '
+            'image, image_variants) VALUES (%s, %s, %s, %s, %s, %s)',
+            (('Текст поста ' * 5, stamp(),
+              int(rnd.paretovariate(1.2)) % args.users + 1,
+              rnd.randint(1, args.groups) if rnd.random() < 0.7 else None,
+              '', '')
+             for _ in range(args.posts)),
+        )
+        insert_chunks(
+            cursor,
+            'INSERT INTO posts_comment (post_id, author_id, text, created) '
+            'VALUES (%s, %s, %s, %s)',
+            ((rnd.randint(1, args.posts), rnd.randint(1, args.users),
+              'Комментарий', stamp())
+             for _ in range(args.comments)),
+        )
+        pairs = set()
+        while len(pairs) < min(args.follows, args.users * (args.users - 1)):
+            user = rnd.randint(1, args.users)
+            author = int(rnd.paretovariate(1.2)) % args.users + 1
+            if user != author:
+                pairs.add((user, author))
+        insert_chunks(
+            cursor,
+            'INSERT INTO posts_follow (user_id, author_id) VALUES (%s, %s)',
+            pairs,
+        )
+        if args.analyze:
+            cursor.execute('ANALYZE')
+
+
+def workload():
+    """Запросы в том виде, в каком их выполняют представления."""
+    from posts.models import Comment, Follow, Post
+
+    author_id = 1
+    group_id = 1
+    post_id = Comment.objects.values_list('post_id', flat=True).first()
+    deep = Post.objects.order_by('-pub_date', '-pk')[5000:5001].get()
+    return {
+        'index': lambda: list(
+            Post.objects.feed_cards().order_by('-pub_date', '-pk')[:10]),
+        'index keyset': lambda: list(
+            Post.objects.feed_cards().order_by('-pub_date', '-pk').filter(
+                pub_date__lt=deep.pub_date)[:11]),
+        'profile': lambda: list(
+            Post.objects.feed_cards().filter(author_id=author_id)
+            .order_by('-pub_date')[:10]),
+        'group': lambda: list(
+            Post.objects.feed_cards().filter(group_id=group_id)
+            .order_by('-pub_date')[:10]),
+        'comments': lambda: list(
+            Comment.objects.filter(post_id=post_id)
+            .select_related('author')),
+        'followers of author': lambda: list(
+            Follow.objects.filter(author_id=author_id)
+            .values_list('user_id', flat=True)[:1000]),
+        'is_subscribed': lambda: Follow.objects.filter(
+            author_id=author_id, user_id=2).exists(),
+    }
+
+
+def plan(queryset_call):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        queryset_call()
+    sql = queries.captured_queries[-1]['sql']
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return '; '.join(row[-1] for row in cursor.fetchall())
+
+
+def measure(repeat):
+    results = {}
+    for name, call in workload().items():
+        call()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = (statistics.median(timings), plan(call))
+    return results
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        settings.DATABASES['default']['NAME'] = os.path.join(
+            directory, 'bench.sqlite3')
+        django.setup()
+        from django.core.management import call_command
+
+        call_command('migrate', verbosity=0)
+        call_command('migrate', 'posts', BEFORE, verbosity=0)
+        started = time.perf_counter()
+        fill(args)
+        print(f'Данные созданы за {time.perf_counter() - started:.1f} с')
+        before = measure(args.repeat)
+        call_command('migrate', 'posts', AFTER, verbosity=0)
+        after = measure(args.repeat)
+
+    print(f'{"запрос":<22}{"до, мс":>10}{"после, мс":>12}')
+    for name, (timing, _) in before.items():
+        print(f'{name:<22}{timing:>10.2f}{after[name][0]:>12.2f}')
+    print()
+    for name in before:
+        print(f'{name}:')
+        print(f'  до:    {before[name][1]}')
+        print(f'  после: {after[name][1]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Лента подписок: JOIN по подпискам, timeline и слияние потоков авторов.
+
+Запуск из каталога yatube/:
+
+    python benchmarks/follow_feed.py --following 50 500 5000
+
+Скрипт создаёт временную базу через generate_dataset, добавляет
+читателей, подписанных на первые N авторов, и раскладывает их ленты,
+как это делает fan_out_post. Для каждого читателя замеряются первая
+и пятая страницы (по курсору) четырьмя способами:
+
+* join — Post.objects.filter(author__following__user=user), как было
+  до материализованных лент;
+* timeline — posts.timeline.Timeline, текущий движок;
+* merge cold — posts.merge_feed с пустым кешем недавних постов;
+* merge warm — он же, когда кеш уже заполнен.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+PAGES = 5
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--following', type=int, nargs='+',
+                        default=[50, 500, 5000])
+    parser.add_argument('--users', type=int, default=6000)
+    parser.add_argument('--posts', type=int, default=300000)
+    parser.add_argument('--repeat', type=int, default=10)
+    return parser.parse_args()
+
+
+def prepare(directory, args):
+    settings.DATABASES['default']['NAME'] = os.path.join(
+        directory, 'bench.sqlite3')
+    settings.CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    }
+    settings.DEBUG = False
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from posts.models import Follow, Post, TimelineEntry, User
+
+    call_command('migrate', verbosity=0)
+    call_command('generate_dataset', users=args.users, posts=args.posts,
+                 comments=0, follows=0, skip_timeline=True, verbosity=0)
+    authors = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    readers = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for count in args.following:
+            reader = User.objects.create_user(username=f'reader{count}')
+            Follow.objects.bulk_create(
+                (Follow(user=reader, author_id=author_id)
+                 for author_id in authors[:count]),
+                batch_size=500)
+            cursor.execute(
+                f'INSERT INTO {TimelineEntry._meta.db_table} '
+                '(user_id, post_id, pub_date) '
+                f'SELECT %s, id, pub_date FROM {Post._meta.db_table} '
+                'WHERE author_id IN (SELECT author_id '
+                f'FROM {Follow._meta.db_table} WHERE user_id = %s)',
+                [reader.pk, reader.pk])
+            readers[count] = reader
+    return readers
+
+
+def engines():
+    from django.core.cache import cache
+    from posts.merge_feed import merged_page
+    from posts.models import Post
+    from posts.paginator import CursorPaginator
+    from posts.timeline import Timeline
+
+    def keyset(queryset):
+        def page(user, cursor):
+            return CursorPaginator(queryset(user).feed_cards()).get_page(
+                cursor)
+        return page
+
+    def cold(user, cursor):
+        cache.clear()
+        return merged_page(user, cursor)
+
+    return {
+        'join': keyset(lambda user: Post.objects.filter(
+            author__following__user=user)),
+        'timeline': lambda user, cursor: Timeline(user).after(cursor),
+        'merge cold': cold,
+        'merge warm': merged_page,
+    }
+
+
+def measure(page, user, repeat):
+    """Медианы времени первой и PAGES-й страницы, в миллисекундах."""
+    cursors = [None]
+    for _ in range(PAGES - 1):
+        page_obj = page(user, cursors[-1])
+        list(page_obj)
+        cursors.append(page_obj.next_cursor)
+    result = []
+    for cursor in (cursors[0], cursors[-1]):
+        page(user, cursor)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(page(user, cursor))
+            timings.append((time.perf_counter() - started) * 1000)
+        result.append(statistics.median(timings))
+    return result
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        readers = prepare(directory, args)
+        print(f'Данные созданы за {time.perf_counter() - started:.1f} с')
+        results = {
+            (count, name): measure(page, reader, args.repeat)
+            for count, reader in readers.items()
+            for name, page in engines().items()
+        }
+    print(f'{"подписок":>9}  {"движок":<12}{"стр. 1, мс":>12}'
+          f'{f"стр. {PAGES}, мс":>12}')
+    for (count, name), (first, deep) in results.items():
+        print(f'{count:>9}  {name:<12}{first:>12.2f}{deep:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Смешанная нагрузка чтения и записи на SQLite до и после настройки.
+
+Запуск из каталога yatube/:
+
+    python benchmarks/sqlite_concurrency.py --readers 6 --writers 2
+
+Скрипт один раз создаёт базу через generate_dataset и для каждого
+режима копирует её и запускает воркеры отдельными процессами:
+
+* plain — django.db.backends.sqlite3, журнал отката, CONN_MAX_AGE=0;
+* tuned — core.backends.sqlite3 (WAL и прагмы), постоянное соединение.
+
+Читатели выбирают страницу ленты и профиль, писатели добавляют
+комментарии. Между операциями вызывается close_old_connections(),
+как на границе HTTP-запроса, поэтому без CONN_MAX_AGE соединение
+открывается заново каждый раз.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+MODES = {
+    'plain': {'ENGINE': 'django.db.backends.sqlite3', 'CONN_MAX_AGE': 0},
+    'tuned': {'ENGINE': 'core.backends.sqlite3', 'CONN_MAX_AGE': 600},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=6)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--posts', type=int, default=50000)
+    parser.add_argument('--worker', choices=('reader', 'writer'),
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    parser.add_argument('--seed', type=int, default=0,
+                        help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def configure(database, mode):
+    settings.DATABASES['default'].update(NAME=database, **MODES[mode])
+    settings.DEBUG = False
+    django.setup()
+
+
+def work(args):
+    """Тело воркера: операции до конца отведённого времени."""
+    import random
+
+    configure(args.database, args.mode)
+    from django.db import OperationalError, close_old_connections
+    from posts.models import Comment, Post, User
+
+    rnd = random.Random(args.seed)
+    last_user = User.objects.order_by('-pk').values_list('pk', flat=True)[0]
+    last_post = Post.objects.order_by('-pk').values_list('pk', flat=True)[0]
+    timings = []
+    errors = 0
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        close_old_connections()
+        started = time.perf_counter()
+        try:
+            if args.worker == 'reader':
+                list(Post.objects.feed_cards()
+                     .order_by('-pub_date', '-pk')[:10])
+                list(Post.objects.feed_cards()
+                     .filter(author_id=rnd.randint(1, last_user))
+                     .order_by('-pub_date')[:10])
+            else:
+                Comment.objects.create(
+                    post_id=rnd.randint(1, last_post),
+                    author_id=rnd.randint(1, last_user),
+                    text='Комментарий из бенчмарка')
+        except OperationalError:
+            errors += 1
+            continue
+        timings.append((time.perf_counter() - started) * 1000)
+    close_old_connections()
+    print(json.dumps({'timings': timings, 'errors': errors}))
+
+
+def prepare(directory, posts):
+    configure(os.path.join(directory, 'template.sqlite3'), 'plain')
+    from django.core.management import call_command
+    from django.db import connections
+
+    settings.CACHES['default']['LOCATION'] = os.path.join(
+        directory, 'cache.sqlite3')
+    call_command('migrate', verbosity=0)
+    call_command('generate_dataset', users=2000, posts=posts,
+                 comments=posts, follows=10000, skip_timeline=True,
+                 verbosity=0)
+    connections.close_all()
+    return settings.DATABASES['default']['NAME']
+
+
+def run(mode, template, directory, args):
+    database = os.path.join(directory, f'{mode}.sqlite3')
+    shutil.copyfile(template, database)
+    roles = ['reader'] * args.readers + ['writer'] * args.writers
+    processes = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker', role,
+             '--mode', mode, '--database', database,
+             '--duration', str(args.duration), '--seed', str(seed)],
+            stdout=subprocess.PIPE, text=True)
+        for seed, role in enumerate(roles)
+    ]
+    results = {'reader': [], 'writer': []}
+    errors = {'reader': 0, 'writer': 0}
+    for role, process in zip(roles, processes):
+        output = json.loads(process.communicate()[0].splitlines()[-1])
+        results[role].extend(output['timings'])
+        errors[role] += output['errors']
+    return {
+        role: {
+            'ops': len(timings) / args.duration,
+            'p50': statistics.median(timings) if timings else 0,
+            'p99': (sorted(timings)[int(len(timings) * 0.99)]
+                    if timings else 0),
+            'errors': errors[role],
+        }
+        for role, timings in results.items()
+    }
+
+
+def main():
+    args = parse_args()
+    if args.worker:
+        work(args)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        template = prepare(directory, args.posts)
+        results = {mode: run(mode, template, directory, args)
+                   for mode in MODES}
+    print(f'{"режим":<8}{"роль":<8}{"оп/с":>10}{"p50, мс":>10}'
+          f'{"p99, мс":>10}{"ошибки":>8}')
+    for mode, roles in results.items():
+        for role, stats in roles.items():
+            print(f'{mode:<8}{role:<8}{stats["ops"]:>10.0f}'
+                  f'{stats["p50"]:>10.2f}{stats["p99"]:>10.2f}'
+                  f'{stats["errors"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3 import base
+from django.dispatch import receiver
+
+# Настройки соединения, которые SQLite не хранит в файле базы.
+# journal_mode=WAL сохраняется в файле, но его дешевле подтвердить.
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite с WAL и настройками для одновременных читателей и писателя.
+
+    Прагмы можно переопределить в OPTIONS['pragmas'] базы. Пока
+    immediate_transactions истинно, внешний atomic() открывается
+    через BEGIN IMMEDIATE и сразу берёт блокировку записи, а не
+    получает SQLITE_BUSY при первой записи посреди транзакции.
+    """
+
+    immediate_transactions = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(
+            'BEGIN IMMEDIATE' if self.immediate_transactions else 'BEGIN')
+
+    @property
+    def pragmas(self):
+        return {**PRAGMAS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+
+
+@receiver(connection_created, sender=DatabaseWrapper)
+def apply_pragmas(sender, connection, **kwargs):
+    with connection.cursor() as cursor:
+        for name, value in connection.pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
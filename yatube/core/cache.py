@@ -0,0 +1,220 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Максимум параметров в одном запросе SQLite.
+CHUNK_SIZE: int = 500
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite (WAL), общий для всех процессов на хосте.
+
+    LOCATION — путь к файлу. Целые числа хранятся как INTEGER, поэтому
+    incr() выполняется в самой базе; остальное — pickle. Вытеснение
+    LRU по столбцу accessed, который обновляется при чтении не чаще
+    раза в TOUCH_INTERVAL секунд, чтобы чтения почти не писали в базу.
+    """
+
+    TOUCH_INTERVAL = 10
+    CULL_CHECK_EVERY = 100
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or getattr(self._local, 'pid', None) != \
+                os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB, '
+                'expires REAL, accessed REAL NOT NULL)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS cache_accessed '
+                'ON cache (accessed)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _dump(value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _write(self, statement, rows):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(statement, rows)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        self._after_write(len(rows))
+
+    def _after_write(self, count):
+        self._writes += count
+        if self._writes >= self.CULL_CHECK_EVERY:
+            self._writes = 0
+            self._cull()
+
+    def _cull(self):
+        connection = self._connection()
+        now = time.time()
+        connection.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (now,))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if not self._cull_frequency:
+            connection.execute('DELETE FROM cache')
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (count // self._cull_frequency,))
+
+    def _fetch(self, keys):
+        """Живые значения по ключам в виде {key: value}."""
+        connection = self._connection()
+        now = time.time()
+        found = {}
+        stale = []
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = connection.execute(
+                'SELECT key, value, expires, accessed FROM cache '
+                f'WHERE key IN ({placeholders})', chunk)
+            for key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    continue
+                found[key] = value
+                if now - accessed > self.TOUCH_INTERVAL:
+                    stale.append(key)
+        if stale:
+            connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                [(now, key) for key in stale])
+        return found
+
+    def _expires(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? '
+                'AND expires IS NOT NULL AND expires <= ?', (key, now))
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)',
+                (key, self._dump(value), self._expires(timeout), now))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        self._after_write(1)
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        found = self._fetch([key])
+        if key not in found:
+            return default
+        return self._load(found[key])
+
+    def get_many(self, keys, version=None):
+        made = {self._key(key, version): key for key in keys}
+        found = self._fetch(list(made))
+        return {made[key]: self._load(value) for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        expires = self._expires(timeout)
+        self._write(
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)',
+            [(self._key(key, version), self._dump(value), expires, now)
+             for key, value in data.items()])
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._expires(timeout), key, time.time()))
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value, expires FROM cache WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                raise ValueError(f"Key '{key}' not found")
+            value = self._load(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (self._dump(value), key))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return key in self._fetch([key])
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        self._write('DELETE FROM cache WHERE key = ?',
+                    [(self._key(key, version),) for key in keys])
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # соединение живёт всё время работы потока
+        pass
@@ -0,0 +1,27 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from posts.feed_cache import bump_feed_generation
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файл реплики для чтения'
+
+    def handle(self, *args, **options):
+        if 'replica' not in settings.DATABASES:
+            raise CommandError('Реплика не настроена: задайте '
+                               'YATUBE_REPLICA_DB')
+        primary = connections['default']
+        primary.ensure_connection()
+        connections['replica'].close()
+        target = sqlite3.connect(settings.DATABASES['replica']['NAME'])
+        try:
+            # backup копирует согласованный снимок, не мешая писателям
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        # фрагменты, закешированные из старой копии, больше не нужны
+        bump_feed_generation()
+        self.stdout.write('Реплика обновлена')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.writes import metrics
+
+
+class Command(BaseCommand):
+    help = 'Показывает число записей и ожидание блокировки SQLite по меткам'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"метка":<36}{"записей":>9}{"ожидание, мс":>14}'
+                          f'{"повторов":>10}{"отказов":>9}')
+        for label, counters in metrics.snapshot().items():
+            writes = counters['writes']
+            average = counters['wait_us'] / writes / 1000 if writes else 0
+            self.stdout.write(
+                f'{label:<36}{writes:>9}{average:>14.2f}'
+                f'{counters["retries"]:>10}{counters["failures"]:>9}')
@@ -0,0 +1,88 @@
+"""Чтение с реплики и запись в основную базу.
+
+ReplicaMiddleware включает реплику на время безопасного запроса к
+приложениям из REPLICA_NAMESPACES. После записи пользователь
+получает куку, и его чтения REPLICA_STICKY_SECONDS секунд идут в
+основную базу, чтобы новый пост или комментарий был виден сразу
+после редиректа.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+REPLICA = 'replica'
+PRIMARY = 'default'
+STICKY_COOKIE = 'primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Сессии меняются при входе и читаются на каждом запросе,
+# отставшая реплика разлогинила бы пользователя.
+PRIMARY_ONLY_APPS = ('sessions',)
+
+_state = threading.local()
+
+
+def mark_written():
+    """Запрос что-то записал: дальше он и пользователь читают
+    основную базу. Нужно, когда запись ушла в другой поток."""
+    _state.wrote = True
+
+
+def use_replica():
+    return (getattr(_state, 'replica', False)
+            and not getattr(_state, 'wrote', False)
+            and REPLICA in settings.DATABASES)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return PRIMARY
+        return REPLICA if use_replica() else PRIMARY
+
+    def db_for_write(self, model, **hints):
+        mark_written()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # реплика — копия основной базы, её не мигрируют
+        return db != REPLICA
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.replica = False
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+            if _state.wrote:
+                window = settings.REPLICA_STICKY_SECONDS
+                response.set_cookie(
+                    STICKY_COOKIE, str(time.time() + window),
+                    max_age=window, httponly=True, samesite='Lax')
+            return response
+        finally:
+            _state.replica = False
+            _state.wrote = False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        namespaces = set(request.resolver_match.namespaces)
+        _state.replica = (
+            request.method in SAFE_METHODS
+            and bool(namespaces & set(settings.REPLICA_NAMESPACES))
+            and not self.is_sticky(request)
+        )
+
+    @staticmethod
+    def is_sticky(request):
+        try:
+            return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+def isolated_caches(directory):
+    """CACHES с теми же бэкендами, но файлы SQLiteCache лежат
+    в directory, а не в общем для хоста cache/."""
+    caches = {}
+    for alias, params in settings.CACHES.items():
+        params = dict(params)
+        if params['BACKEND'] == 'core.cache.SQLiteCache':
+            params['LOCATION'] = os.path.join(directory, f'{alias}.sqlite3')
+        caches[alias] = params
+    return caches
+
+
+class TestRunner(DiscoverRunner):
+    """Запуск тестов со своим временным кешем: cache.clear() в тестах
+    не трогает кеш, общий для воркеров на хосте, а записи из
+    разработки не попадают в тесты."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_directory = tempfile.mkdtemp(prefix='yatube-cache-')
+        self._caches = override_settings(
+            CACHES=isolated_caches(self._cache_directory))
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.disable()
+        shutil.rmtree(self._cache_directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
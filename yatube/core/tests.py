@@ -0,0 +1,275 @@
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from posts.feed_cache import GENERATION_KEY, feed_key
+from posts.models import Group, Post
+from posts.tests.on_commit import run_on_commit
+
+from . import writes
+from .cache import SQLiteCache
+from .routers import STICKY_COOKIE, ReplicaMiddleware, ReplicaRouter
+
+
+def _incr_in_child(path, times):
+    cache = SQLiteCache(path, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.path, {
+            'OPTIONS': {'MAX_ENTRIES': 10000}})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_set_get_delete(self):
+        self.cache.set('key', {'value': [1, 2]})
+        self.assertEqual(self.cache.get('key'), {'value': [1, 2]})
+        self.assertTrue(self.cache.has_key('key'))
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_expiry_and_add(self):
+        self.cache.set('key', 1, timeout=0.05)
+        self.assertFalse(self.cache.add('key', 2))
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 3))
+        self.assertEqual(self.cache.get('key'), 3)
+
+    def test_get_many_set_many(self):
+        self.cache.set_many({f'key{i}': i for i in range(1200)})
+        values = self.cache.get_many([f'key{i}' for i in range(1300)])
+        self.assertEqual(values, {f'key{i}': i for i in range(1200)})
+
+    def test_incr(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        self.assertEqual(self.cache.decr('counter'), 5)
+
+    def test_shared_between_processes(self):
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_incr_in_child,
+                                     args=(self.path, 50))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
+    def test_lru_cull(self):
+        cache = SQLiteCache(self.path, {
+            'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2}})
+        cache.CULL_CHECK_EVERY = 1
+        for i in range(10):
+            cache.set(f'key{i}', i)
+        cache.TOUCH_INTERVAL = -1
+        cache.get('key0')
+        cache.set('key10', 10)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(cache.get('key10'), 10)
+
+
+class TunedSQLiteTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.connections = ConnectionHandler({'default': {
+            'ENGINE': 'core.backends.sqlite3',
+            'NAME': os.path.join(self.directory, 'db.sqlite3'),
+            'OPTIONS': {'pragmas': {'cache_size': -1000}},
+        }})
+
+    def tearDown(self):
+        self.connections.close_all()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def pragma(self, name):
+        with self.connections['default'].cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('cache_size'), -1000)
+
+
+LOCMEM = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'writes-test',
+}}
+
+
+@override_settings(CACHES=LOCMEM, WRITE_RETRY_DELAY=0,
+                   WRITE_METRICS_FLUSH=0)
+class WritesTest(TransactionTestCase):
+    def setUp(self):
+        writes.metrics.snapshot()
+        cache.clear()
+
+    def test_write_opens_immediate_transaction(self):
+        with CaptureQueriesContext(connection) as queries:
+            writes.run('test', Group.objects.create, slug='a', title='A')
+        self.assertEqual(queries.captured_queries[0]['sql'],
+                         'BEGIN IMMEDIATE')
+        self.assertEqual(writes.metrics.snapshot()['test']['writes'], 1)
+
+    def test_locked_write_is_retried(self):
+        func = mock.Mock(side_effect=[
+            OperationalError('database is locked'),
+            OperationalError('database is locked'),
+            'done',
+        ])
+        self.assertEqual(writes.run('test', func), 'done')
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(writes.metrics.snapshot()['test']['retries'], 2)
+
+    @override_settings(WRITE_RETRIES=1)
+    def test_gives_up_after_retries(self):
+        func = mock.Mock(side_effect=OperationalError('database is locked'))
+        with self.assertRaises(OperationalError):
+            writes.run('test', func)
+        self.assertEqual(func.call_count, 2)
+        self.assertEqual(writes.metrics.snapshot()['test']['failures'], 1)
+
+    def test_other_errors_are_not_retried(self):
+        func = mock.Mock(side_effect=OperationalError('no such table'))
+        with self.assertRaises(OperationalError):
+            writes.run('test', func)
+        self.assertEqual(func.call_count, 1)
+
+    @override_settings(WRITE_QUEUE=True, WRITE_QUEUE_WAIT=0.05)
+    def test_queue_commits_batch_and_isolates_failures(self):
+        Group.objects.create(slug='taken', title='Занято')
+        errors = []
+
+        def create(slug):
+            try:
+                writes.run('test', Group.objects.create,
+                           slug=slug, title=slug)
+            except IntegrityError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=create, args=(slug,))
+                   for slug in ('one', 'two', 'taken', 'three')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(Group.objects.count(), 4)
+        counters = writes.metrics.snapshot()
+        self.assertEqual(counters['test']['writes'], 4)
+        self.assertLess(counters['writer']['writes'], 4)
+
+
+with_replica = mock.patch.dict(settings.DATABASES, {'replica': {
+    **settings.DATABASES['default'], 'NAME': 'replica.sqlite3'}})
+
+
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def request(self, method, path, write=False, cookies=None):
+        """Прогоняет запрос через middleware и возвращает базы,
+        выбранные роутером внутри представления."""
+        request = getattr(self.factory, method)(path)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = match = resolve(path)
+        seen = {}
+
+        def view(request):
+            middleware.process_view(request, match.func, match.args,
+                                    match.kwargs)
+            seen['read'] = self.router.db_for_read(Post)
+            seen['session'] = self.router.db_for_read(Session)
+            seen['key'] = feed_key(request, 'index')
+            if write:
+                seen['write'] = self.router.db_for_write(Post)
+                seen['after_write'] = self.router.db_for_read(Post)
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(view)
+        seen['response'] = middleware(request)
+        return seen
+
+    @with_replica
+    def test_safe_requests_read_replica(self):
+        seen = self.request('get', '/')
+        self.assertEqual(seen['read'], 'replica')
+        self.assertEqual(seen['session'], 'default')
+        self.assertEqual(self.request('get', '/about/tech/')['read'],
+                         'replica')
+        self.assertEqual(self.request('get', '/admin/login/')['read'],
+                         'default')
+
+    @with_replica
+    def test_writes_go_to_primary_and_stick(self):
+        seen = self.request('post', '/create/', write=True)
+        self.assertEqual(seen['read'], 'default')
+        self.assertEqual(seen['write'], 'default')
+        cookie = seen['response'].cookies[STICKY_COOKIE]
+        seen = self.request('get', '/', cookies={STICKY_COOKIE: cookie.value})
+        self.assertEqual(seen['read'], 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    @with_replica
+    def test_write_during_get_switches_to_primary(self):
+        seen = self.request('get', '/profile/auth/follow/', write=True)
+        self.assertEqual(seen['read'], 'replica')
+        self.assertEqual(seen['after_write'], 'default')
+        self.assertIn(STICKY_COOKIE, seen['response'].cookies)
+
+    @with_replica
+    def test_feed_key_depends_on_database(self):
+        replica = self.request('get', '/')['key']
+        primary = self.request('get', '/', cookies={
+            STICKY_COOKIE: str(time.time() + 10)})['key']
+        self.assertNotEqual(replica, primary)
+
+    def test_without_replica_everything_reads_primary(self):
+        self.assertEqual(self.request('get', '/')['read'], 'default')
+
+
+class RefreshReplicaTest(TestCase):
+    def test_refresh_invalidates_cached_feeds(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        replica = {**connection.settings_dict,
+                   'NAME': os.path.join(directory, 'replica.sqlite3')}
+        generation = cache.get_or_set(GENERATION_KEY, 1, None)
+        with mock.patch.dict(settings.DATABASES, {'replica': replica}), \
+                mock.patch.dict(connections.databases, {'replica': replica}):
+            with run_on_commit():
+                call_command('refresh_replica', stdout=io.StringIO())
+            connections['replica'].close()
+        self.assertEqual(cache.get(GENERATION_KEY), generation + 1)
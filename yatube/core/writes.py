@@ -0,0 +1,223 @@
+"""Согласованная запись в SQLite.
+
+SQLite допускает одного писателя на файл. Запись открывается через
+BEGIN IMMEDIATE, а при «database is locked» повторяется с растущей
+случайной паузой. При WRITE_QUEUE мелкие записи выполняются в одном
+потоке-писателе, который коммитит их пачками (group commit).
+Время ожидания блокировки копится по меткам, обычно по имени
+представления, и видно в команде write_metrics.
+"""
+import logging
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, close_old_connections, transaction
+
+from . import routers
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'writes:{label}:{field}'
+LABELS_KEY = 'writes:labels'
+FIELDS = ('writes', 'wait_us', 'retries', 'failures')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def is_locked(error):
+    message = str(error)
+    return 'database is locked' in message or 'database is busy' in message
+
+
+class WriteMetrics:
+    """Счётчики процесса, которые раз в WRITE_METRICS_FLUSH секунд
+    переносятся в общий кеш, чтобы их видели все воркеры."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+        self._flushed = time.monotonic()
+
+    def record(self, label, **values):
+        with self._lock:
+            counters = self._pending[label]
+            for field, value in values.items():
+                counters[field] += value
+        if time.monotonic() - self._flushed > _setting(
+                'WRITE_METRICS_FLUSH', 5):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(
+                lambda: dict.fromkeys(FIELDS, 0))
+            self._flushed = time.monotonic()
+        if not pending:
+            return
+        labels = cache.get(LABELS_KEY, set())
+        if not labels.issuperset(pending):
+            cache.set(LABELS_KEY, labels | set(pending), None)
+        for label, counters in pending.items():
+            for field, value in counters.items():
+                if not value:
+                    continue
+                key = METRICS_KEY.format(label=label, field=field)
+                if not cache.add(key, value, None):
+                    cache.incr(key, value)
+
+    def snapshot(self):
+        """Счётчики всех процессов: {метка: {поле: значение}}."""
+        self.flush()
+        labels = sorted(cache.get(LABELS_KEY, set()))
+        keys = {METRICS_KEY.format(label=label, field=field): (label, field)
+                for label in labels for field in FIELDS}
+        values = cache.get_many(list(keys))
+        result = {label: dict.fromkeys(FIELDS, 0) for label in labels}
+        for key, value in values.items():
+            label, field = keys[key]
+            result[label][field] = value
+        return result
+
+
+metrics = WriteMetrics()
+
+
+@contextmanager
+def begin_immediate(label):
+    """Транзакция, которая сразу берёт блокировку записи.
+
+    Внутри уже открытой транзакции ничего не делает: блокировкой
+    распоряжается внешний блок.
+    """
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        yield
+        return
+    connection.immediate_transactions = True
+    started = time.perf_counter()
+    try:
+        with transaction.atomic():
+            connection.immediate_transactions = False
+            metrics.record(label, writes=1, wait_us=int(
+                (time.perf_counter() - started) * 1e6))
+            yield
+    finally:
+        connection.immediate_transactions = False
+
+
+def with_retries(label, func, *args, **kwargs):
+    """Выполняет func в BEGIN IMMEDIATE, повторяя при блокировке."""
+    retries = _setting('WRITE_RETRIES', 5)
+    delay = _setting('WRITE_RETRY_DELAY', 0.02)
+    for attempt in range(retries + 1):
+        try:
+            with begin_immediate(label):
+                return func(*args, **kwargs)
+        except OperationalError as error:
+            nested = transaction.get_connection().in_atomic_block
+            if not is_locked(error) or nested or attempt == retries:
+                if is_locked(error):
+                    metrics.record(label, failures=1)
+                raise
+            pause = random.uniform(0, delay * 2 ** attempt)
+            metrics.record(label, retries=1, wait_us=int(pause * 1e6))
+            logger.info('%s: база занята, повтор через %.3f с',
+                        label, pause)
+            time.sleep(pause)
+
+
+class WriteQueue:
+    """Поток-писатель: собирает записи до WRITE_QUEUE_BATCH штук или
+    WRITE_QUEUE_WAIT секунд и коммитит их одной транзакцией.
+
+    Каждая запись идёт в своей точке сохранения, так что ошибка одной
+    не откатывает остальные.
+    """
+
+    def __init__(self):
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, label, func, *args, **kwargs):
+        self._ensure_thread()
+        future = Future()
+        self._jobs.put((label, func, args, kwargs, future,
+                        time.perf_counter()))
+        return future.result()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        batch = [self._jobs.get()]
+        deadline = time.perf_counter() + _setting('WRITE_QUEUE_WAIT', 0.002)
+        while len(batch) < _setting('WRITE_QUEUE_BATCH', 50):
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._jobs.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            close_old_connections()
+            try:
+                outcomes = with_retries('writer', self._run_batch, batch)
+            except Exception as error:
+                for *_, future, _ in batch:
+                    future.set_exception(error)
+                continue
+            for (label, *_, future, queued), (ok, value) in zip(
+                    batch, outcomes):
+                metrics.record(label, writes=1, wait_us=int(
+                    (time.perf_counter() - queued) * 1e6))
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    @staticmethod
+    def _run_batch(batch):
+        outcomes = []
+        for label, func, args, kwargs, *_ in batch:
+            try:
+                with transaction.atomic():
+                    outcomes.append((True, func(*args, **kwargs)))
+            except OperationalError as error:
+                if is_locked(error):
+                    raise
+                outcomes.append((False, error))
+            except Exception as error:
+                outcomes.append((False, error))
+        return outcomes
+
+
+writer = WriteQueue()
+
+
+def run(label, func, *args, **kwargs):
+    """Выполняет небольшую запись: через поток-писатель при WRITE_QUEUE,
+    иначе на месте с BEGIN IMMEDIATE и повторами."""
+    if (_setting('WRITE_QUEUE', False)
+            and not transaction.get_connection().in_atomic_block):
+        routers.mark_written()
+        return writer.submit(label, func, *args, **kwargs)
+    return with_retries(label, func, *args, **kwargs)
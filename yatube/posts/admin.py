@@ -1,6 +1,8 @@
 from django.contrib import admin
 
 from .models import Group, Post
+from .paginator import CountedPaginator
+from .search import get_backend
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -10,6 +12,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
 
     empty_value_display = '-пусто-'
+    # число постов берётся из счётчиков, а не из COUNT(*)
+    paginator = CountedPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return get_backend().filter(queryset, search_term), False
 
 
 admin.site.register(Post, PostAdmin)
@@ -0,0 +1,49 @@
+"""Валидаторы условных GET-запросов для лент и страниц постов.
+
+ETag строится из ключа страницы ленты (включает поколение, которое
+сбрасывается при записи) и пользователя: шапка, кнопка подписки и форма
+комментария у каждого свои. Last-Modified не отдаётся: HTTP-дата
+точна до секунды, и запись в ту же секунду, что и прошлый ответ,
+дала бы клиенту 304 на устаревшую страницу.
+"""
+import hashlib
+
+from .feed_cache import feed_key, last_modified
+from .models import Comment
+
+
+def _etag(request, *parts):
+    viewer = request.user.pk if request.user.is_authenticated else 'anon'
+    raw = ':'.join(map(str, (*parts, viewer)))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _latest_comment(request, post_id):
+    if not hasattr(request, '_latest_comment'):
+        request._latest_comment = (
+            Comment.objects.filter(post_id=post_id)
+            .order_by('-created').values_list('created', flat=True).first()
+        )
+    return request._latest_comment
+
+
+def index_etag(request):
+    return _etag(request, feed_key(request, 'index'))
+
+
+def group_etag(request, slug):
+    return _etag(request, feed_key(request, 'group', slug))
+
+
+def profile_etag(request, username):
+    return _etag(request, feed_key(request, 'profile', username),
+                 last_modified())
+
+
+def follow_etag(request):
+    return _etag(request, feed_key(request, 'follow', request.user.pk))
+
+
+def post_etag(request, post_id):
+    return _etag(request, feed_key(request, 'post', post_id),
+                 _latest_comment(request, post_id))
@@ -0,0 +1,185 @@
+"""Счётчики строк вместо COUNT(*).
+
+Число постов и комментариев хранится в RowCount по областям: все
+посты, посты группы, комментарии поста. Посты автора уже считает
+AuthorStats. Сигналы сдвигают счётчики при записи, а команда
+reconcile_counts, запускаемая по расписанию, сверяет их с таблицами.
+Число приблизительное: между сверками оно может разойтись с таблицей,
+например после массовых update() и delete() в обход сигналов.
+
+Удаление комментария сигнал не ловит: с получателем post_delete
+Django удалял бы комментарии поста по одному. Их снимает со счёта
+удаление поста, остальное исправляет сверка.
+"""
+from django.db.models import Count, F
+from django.db.models.expressions import Col
+from django.db.models.lookups import Exact
+from django.db.models.query import QuerySet
+
+from . import stats
+from .models import Comment, Post, RowCount, User
+
+BATCH_SIZE: int = 500
+
+# Поля, по значениям которых ведутся отдельные счётчики.
+SCOPES = {
+    Post: ('group',),
+    Comment: ('post',),
+}
+
+
+def scope(model, field=None, value=None):
+    key = model._meta.label_lower
+    if field is None:
+        return key
+    return f'{key}:{field}={value}'
+
+
+def _queryset(model, field=None, value=None):
+    if field is None:
+        return model.objects.all()
+    return model.objects.filter(**{field: value})
+
+
+def scopes_of(instance):
+    """Области объекта или None, если нужные поля не загружены."""
+    model = type(instance)
+    scopes = [(None, None)]
+    for field in SCOPES[model]:
+        attname = model._meta.get_field(field).attname
+        if attname not in instance.__dict__:
+            return None
+        value = instance.__dict__[attname]
+        if value is not None:
+            scopes.append((field, value))
+    return scopes
+
+
+def bump(model, scopes, delta):
+    """Сдвигает счётчики областей на delta.
+
+    Недостающая строка при добавлении создаётся подсчётом, при
+    удалении пропускается: её заполнит сверка или следующая запись.
+    """
+    for field, value in scopes:
+        key = scope(model, field, value)
+        updated = RowCount.objects.filter(scope=key).update(
+            count=F('count') + delta)
+        if not updated and delta > 0:
+            RowCount.objects.bulk_create(
+                [RowCount(scope=key,
+                          count=_queryset(model, field, value).count())],
+                ignore_conflicts=True,
+            )
+
+
+def remember(instance):
+    """Запоминает области загруженного объекта, чтобы после правки
+    перенести его из старых областей в новые."""
+    instance._count_scopes = scopes_of(instance)
+
+
+def saved(instance, created):
+    model = type(instance)
+    current = scopes_of(instance)
+    if created:
+        bump(model, current or [(None, None)], 1)
+    else:
+        previous = getattr(instance, '_count_scopes', None)
+        if previous is not None and current is not None:
+            bump(model, [s for s in previous if s not in current], -1)
+            bump(model, [s for s in current if s not in previous], 1)
+    instance._count_scopes = current
+
+
+def deleted(instance):
+    model = type(instance)
+    bump(model, scopes_of(instance) or [(None, None)], -1)
+    if model is Post:
+        # комментарии поста удаляются каскадом одним DELETE:
+        # общий счётчик уменьшается на их число разом
+        comments = RowCount.objects.filter(
+            scope=scope(Comment, 'post', instance.pk))
+        for count in comments.values_list('count', flat=True):
+            if count:
+                bump(Comment, [(None, None)], -count)
+        comments.delete()
+
+
+def _filter_of(queryset):
+    """(поле, значение) единственного фильтра queryset, (None, None)
+    без фильтров или None, если счётчика для такого запроса нет."""
+    query = queryset.query
+    model = queryset.model
+    if (model not in SCOPES or query.distinct or query.combinator
+            or query.low_mark or query.high_mark is not None
+            or query.group_by is not None or query.where.negated):
+        return None
+    lookups = query.where.children
+    if not lookups:
+        return None, None
+    if len(lookups) > 1:
+        return None
+    lookup = lookups[0]
+    if not (isinstance(lookup, Exact) and isinstance(lookup.lhs, Col)
+            and isinstance(lookup.rhs, int)):
+        return None
+    field = lookup.lhs.target
+    if field.model is not model:
+        return None
+    if field.name in SCOPES[model] or (
+            model is Post and field.name == 'author'):
+        return field.name, lookup.rhs
+    return None
+
+
+def cached_count(queryset):
+    """Число строк queryset из счётчиков или None, если его нужно
+    считать через COUNT(*)."""
+    if not isinstance(queryset, QuerySet):
+        return None
+    found = _filter_of(queryset)
+    if found is None:
+        return None
+    field, value = found
+    model = queryset.model
+    if model is Post and field == 'author':
+        return stats.get_stats(User(pk=value)).posts_count
+    counts = RowCount.objects.filter(
+        scope=scope(model, field, value)).values_list('count', flat=True)
+    for count in counts:
+        return max(count, 0)
+    return None
+
+
+def _actual():
+    actual = {}
+    for model, fields in SCOPES.items():
+        actual[scope(model)] = model.objects.count()
+        for field in fields:
+            rows = (model.objects.filter(**{f'{field}__isnull': False})
+                    .values(field).annotate(total=Count('pk')).order_by())
+            for row in rows:
+                actual[scope(model, field, row[field])] = row['total']
+    return actual
+
+
+def reconcile():
+    """Сверяет счётчики с таблицами: исправляет разошедшиеся и создаёт
+    недостающие. Возвращает число исправленных строк.
+
+    AuthorStats сверяет команда recount_author_stats.
+    """
+    actual = _actual()
+    stored = dict(RowCount.objects.values_list('scope', 'count'))
+    fixed = 0
+    for key, count in stored.items():
+        if actual.get(key, 0) != count:
+            RowCount.objects.filter(scope=key).update(
+                count=actual.get(key, 0))
+            fixed += 1
+    missing = [RowCount(scope=key, count=count)
+               for key, count in actual.items() if key not in stored]
+    RowCount.objects.bulk_create(
+        missing, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return fixed + len(missing)
@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils import timezone
+
+from .models import Post
+
+GENERATION_KEY = 'posts:feed_generation'
+FOLLOW_GENERATION_KEY = 'posts:follow_generation:{}'
+MODIFIED_KEY = 'posts:modified'
+
+
+def _generation(key):
+    return cache.get_or_set(key, 1, None)
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+    cache.set(MODIFIED_KEY, timezone.now(), None)
+
+
+def last_modified():
+    """Время последней записи поста или подписки.
+
+    Если отметка потеряна вместе с кешем, страницы считаются
+    изменёнными только что.
+    """
+    return cache.get_or_set(MODIFIED_KEY, timezone.now, None)
+
+
+def bump_feed_generation():
+    """Делает устаревшими закешированные страницы всех лент.
+
+    Поколение сдвигается после коммита текущей транзакции: сдвинутое
+    раньше, оно дало бы читателю новый ключ, под которым тот закешировал
+    бы страницу из старого снимка базы.
+    """
+    transaction.on_commit(lambda: _bump(GENERATION_KEY))
+
+
+def bump_follow_generation(user_id):
+    """Делает устаревшей закешированную ленту подписок пользователя,
+    тоже после коммита."""
+    key = FOLLOW_GENERATION_KEY.format(user_id)
+    transaction.on_commit(lambda: _bump(key))
+
+
+def feed_key(request, feed, *parts):
+    """Ключ страницы ленты.
+
+    Учитывает ленту, страницу или курсор, базу, из которой читается
+    запрос, и поколение ленты, которое увеличивается при каждой
+    записи поста и обновлении реплики. Без базы в ключе страница,
+    собранная из отставшей реплики, досталась бы читателю основной
+    базы, только что увидевшему свою запись.
+    """
+    page = 'page=1'
+    for param in ('cursor', 'before', 'page'):
+        if request.GET.get(param):
+            page = f'{param}={request.GET[param]}'
+            break
+    alias = router.db_for_read(Post)
+    generations = [_generation(GENERATION_KEY)]
+    if feed == 'follow':
+        generations.append(
+            _generation(FOLLOW_GENERATION_KEY.format(request.user.pk)))
+    return ':'.join(map(str, (feed, *parts, page, alias, *generations)))
+
+
+def feed_cache_context(request, feed, *parts):
+    """Ключ и время жизни фрагмента ленты для тега {% cache %}."""
+    return {
+        'feed_cache_key': feed_key(request, feed, *parts),
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
+    }
@@ -0,0 +1,149 @@
+"""Граф подписок: кто на кого подписан.
+
+Для каждого пользователя в общем кеше лежит отсортированный массив
+id авторов (array, 4 байта на id). Проверка «подписан ли я» —
+двоичный поиск в нём без запроса к базе. Сигналы Follow сбрасывают
+массив подписчика, и при следующем чтении он строится одним запросом.
+
+follow и unfollow меняют подписки пачкой: одна вставка с пропуском
+существующих строк или одно удаление без сигналов. Счётчики, ленты
+и кеши обновляют followed и unfollowed — один раз на пачку; сигналы
+Follow вызывают их же для одиночной подписки.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.transaction import TransactionManagementError
+
+from . import feed_cache, stats, timeline
+from .models import Follow
+
+FOLLOWING_KEY = 'posts:following:{}'
+BATCH_SIZE: int = 500
+
+
+def _pack(author_ids):
+    ids = sorted(author_ids)
+    typecode = 'I' if not ids or ids[-1] < 2 ** 32 else 'q'
+    return array(typecode, ids)
+
+
+def forget(user_id):
+    """Сбрасывает массив подписок пользователя после коммита записи
+    Follow, чтобы его не собрали заново из старого снимка."""
+    key = FOLLOWING_KEY.format(user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def following_ids(user):
+    """Отсортированный массив id авторов, на которых подписан user."""
+    if not user.is_authenticated:
+        return array('I')
+    key = FOLLOWING_KEY.format(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = _pack(Follow.objects.filter(user_id=user.pk).order_by()
+                    .values_list('author_id', flat=True))
+        cache.set(key, ids, settings.FEED_CACHE_TIMEOUT)
+    return ids
+
+
+def _contains(ids, author_id):
+    index = bisect_left(ids, author_id)
+    return index < len(ids) and ids[index] == author_id
+
+
+def is_following(user, author_id):
+    return _contains(following_ids(user), author_id)
+
+
+def following_many(user, author_ids):
+    """Множество тех из author_ids, на кого подписан user."""
+    ids = following_ids(user)
+    return {author_id for author_id in author_ids
+            if _contains(ids, author_id)}
+
+
+def _changed(user_id, author_ids, delta):
+    stats.bump_many(author_ids, 'followers_count', delta)
+    stats.bump(user_id, 'following_count', delta * len(author_ids))
+    if delta > 0:
+        timeline.backfill_many(user_id, author_ids)
+    else:
+        timeline.trim_many(user_id, author_ids)
+    feed_cache.bump_follow_generation(user_id)
+    forget(user_id)
+
+
+def followed(user_id, author_ids):
+    """Учитывает новые подписки user_id на авторов: счётчики, лента
+    подписок и кеши."""
+    _changed(user_id, author_ids, 1)
+
+
+def unfollowed(user_id, author_ids):
+    """Учитывает отписку user_id от авторов."""
+    _changed(user_id, author_ids, -1)
+
+
+def _require_write_transaction(name):
+    connection = transaction.get_connection(router.db_for_write(Follow))
+    if not connection.in_atomic_block:
+        raise TransactionManagementError(
+            f'{name} выполняется только внутри транзакции записи '
+            f'(core.writes.run)')
+
+
+def follow(user, author_ids):
+    """Подписывает user на авторов, пропуская уже существующие
+    подписки. Возвращает id авторов, подписка на которых появилась.
+
+    Проверка и вставка — два запроса, и счётчики верны, только пока
+    их не разделяет параллельная подписка. Поэтому функция работает
+    лишь внутри транзакции записи (core.writes.run): BEGIN IMMEDIATE
+    выполняет такие транзакции по очереди, а вне транзакции
+    поднимается TransactionManagementError. ignore_conflicts не даёт
+    упасть на user_author_unique там, где блокировки нет.
+    """
+    _require_write_transaction('follow')
+    wanted = set(author_ids) - {user.pk}
+    existing = set(Follow.objects.filter(
+        user_id=user.pk, author_id__in=wanted,
+    ).values_list('author_id', flat=True))
+    new = sorted(wanted - existing)
+    if not new:
+        return []
+    Follow.objects.bulk_create(
+        (Follow(user_id=user.pk, author_id=pk) for pk in new),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    followed(user.pk, new)
+    return new
+
+
+def unfollow(user, author_ids):
+    """Отписывает user от авторов. Возвращает id тех, от кого
+    действительно отписал. Как и follow, работает только внутри
+    транзакции записи."""
+    _require_write_transaction('unfollow')
+    gone = sorted(Follow.objects.filter(
+        user_id=user.pk, author_id__in=set(author_ids),
+    ).values_list('author_id', flat=True))
+    if not gone:
+        return []
+    # queryset.delete() отправил бы post_delete на каждую подписку
+    connection = connections[router.db_for_write(Follow)]
+    meta = Follow._meta
+    placeholders = ', '.join(['%s'] * len(gone))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {meta.db_table} '
+            f'WHERE {meta.get_field("user").column} = %s '
+            f'AND {meta.get_field("author").column} IN ({placeholders})',
+            [user.pk, *gone])
+    unfollowed(user.pk, gone)
+    return gone
@@ -0,0 +1,90 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Формат Pillow: (MIME-тип, расширение, параметры сохранения).
+FORMATS = {
+    'AVIF': ('image/avif', 'avif', {'quality': 60}),
+    'WEBP': ('image/webp', 'webp', {'quality': 80, 'method': 6}),
+    'JPEG': ('image/jpeg', 'jpg', {'quality': 85, 'optimize': True,
+                                   'progressive': True}),
+}
+
+
+def supported_formats():
+    """Форматы из IMAGE_VARIANT_FORMATS, которые умеет сохранять Pillow."""
+    Image.init()
+    return [fmt for fmt in settings.IMAGE_VARIANT_FORMATS
+            if fmt in Image.SAVE]
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    _, _, options = FORMATS[fmt]
+    if fmt == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    # без exif=... Pillow не переносит EXIF в новый файл
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def _variants_dir(post_id):
+    return os.path.join('posts', 'variants', str(post_id))
+
+
+def delete_variants(post_id):
+    """Удаляет файлы вариантов картинки поста."""
+    directory = _variants_dir(post_id)
+    try:
+        _, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for file_name in files:
+        default_storage.delete(os.path.join(directory, file_name))
+
+
+def _widths(original):
+    """Ширины из IMAGE_VARIANT_WIDTHS, для которых картинку не нужно
+    увеличивать; для совсем маленькой — её собственная ширина."""
+    ratio_width, ratio_height = settings.IMAGE_VARIANT_RATIO
+    largest = min(original.width,
+                  original.height * ratio_width // ratio_height)
+    return ([width for width in settings.IMAGE_VARIANT_WIDTHS
+             if width <= largest] or [max(largest, 1)])
+
+
+def build_variants(name, post_id):
+    """Нарезает картинку поста на ширины IMAGE_VARIANT_WIDTHS, не
+    большие её самой; файлы прежних вариантов удаляются.
+
+    Возвращает метаданные вариантов для Post.image_variants.
+    """
+    ratio_width, ratio_height = settings.IMAGE_VARIANT_RATIO
+    with default_storage.open(name) as source:
+        original = Image.open(source)
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA')
+        delete_variants(post_id)
+        variants = []
+        for width in _widths(original):
+            height = max(round(width * ratio_height / ratio_width), 1)
+            resized = ImageOps.fit(original, (width, height),
+                                   Image.LANCZOS)
+            for fmt in supported_formats():
+                mime, extension, _ = FORMATS[fmt]
+                path = os.path.join(
+                    _variants_dir(post_id), f'{width}.{extension}')
+                path = default_storage.save(
+                    path, ContentFile(_encode(resized, fmt)))
+                variants.append({
+                    'type': mime,
+                    'width': width,
+                    'height': height,
+                    'name': path,
+                })
+    return variants
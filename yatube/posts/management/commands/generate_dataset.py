@@ -0,0 +1,259 @@
+import io
+import itertools
+import random
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from PIL import Image
+
+from posts import counts, timeline, trending
+from posts.feed_cache import bump_feed_generation
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry,
+                          User)
+from posts.search import get_backend
+from posts.stats import recount
+from posts.timeline import fanout_limit
+
+WORDS = (
+    'кошка', 'собака', 'город', 'море', 'дорога', 'утро', 'вечер', 'книга',
+    'музыка', 'поезд', 'работа', 'друзья', 'погода', 'солнце', 'дождь',
+    'лес', 'река', 'горы', 'чай', 'кофе', 'рецепт', 'фотография', 'отпуск',
+    'программа', 'проект', 'идея', 'новость', 'история', 'сад', 'зима',
+    'лето', 'весна', 'осень', 'праздник', 'кино', 'театр', 'спорт',
+    'велосипед', 'прогулка', 'ужин', 'сегодня', 'вчера', 'очень', 'снова',
+    'наконец', 'хороший', 'новый', 'старый', 'большой', 'тихий',
+)
+START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+SPAN = timedelta(days=365 * 3)
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетические данные для нагрузочных тестов: '
+            'пользователей, группы, посты, комментарии и подписки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows', type=int, default=20000,
+            help='примерное число подписок')
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='показатель степенного распределения авторов')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=20000)
+        parser.add_argument(
+            '--images', type=int, default=0,
+            help='число картинок-заглушек для Post.image')
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.1,
+            help='доля постов с картинкой')
+        parser.add_argument(
+            '--skip-timeline', action='store_true',
+            help='не раскладывать посты по лентам подписок: при популярных '
+                 'авторах это сотни миллионов строк')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('Нужно хотя бы два пользователя')
+        self.rnd = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+        self.user_ids = self._next_ids(User, options['users'])
+        self.group_ids = self._next_ids(Group, options['groups'])
+        self.post_ids = self._next_ids(Post, options['posts'])
+        self.weights = self._power_law(options['alpha'])
+        self.images = self._placeholder_images(options['images'])
+        self.image_ratio = options['image_ratio']
+
+        self._insert('пользователи', User, (
+            'id', 'password', 'is_superuser', 'username', 'first_name',
+            'last_name', 'email', 'is_staff', 'is_active', 'date_joined',
+        ), self._users())
+        self._insert('группы', Group, ('id', 'title', 'slug', 'description'),
+                     self._groups())
+        self._insert('посты', Post, (
+            'id', 'text', 'pub_date', 'author', 'group', 'image',
+            'image_variants',
+        ), self._posts(), self._index)
+        self._insert('комментарии', Comment,
+                     ('post', 'author', 'text', 'created'),
+                     self._comments(options['comments']))
+        self._insert('подписки', Follow, ('user', 'author'),
+                     self._follows(options['follows']))
+        if not options['skip_timeline']:
+            self._fill_timeline()
+        self._recount()
+        # авторов сверх порога _fill_timeline не раскладывал,
+        # здесь они только получат режим pull
+        timeline.rebalance()
+        counts.reconcile()
+        trending.rebuild()
+        bump_feed_generation()
+
+    def _log(self, message):
+        if self.verbosity:
+            self.stdout.write(message)
+
+    @staticmethod
+    def _next_ids(model, count):
+        """Первичные ключи задаются явно, чтобы сразу строить связи."""
+        start = (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        return range(start, start + count)
+
+    def _power_law(self, alpha):
+        """Накопленные веса закона Ципфа по перемешанным авторам."""
+        ranks = list(self.user_ids)
+        self.rnd.shuffle(ranks)
+        self.ranked_authors = ranks
+        return list(itertools.accumulate(
+            1 / rank ** alpha for rank in range(1, len(ranks) + 1)))
+
+    def _authors(self, count):
+        return self.rnd.choices(
+            self.ranked_authors, cum_weights=self.weights, k=count)
+
+    def _placeholder_images(self, count):
+        names = []
+        for number in range(count):
+            color = tuple(self.rnd.randrange(256) for _ in range(3))
+            buffer = io.BytesIO()
+            Image.new('RGB', (960, 339), color).save(buffer, 'JPEG')
+            names.append(default_storage.save(
+                f'posts/placeholder-{number}.jpg',
+                ContentFile(buffer.getvalue())))
+        return names
+
+    def _post_date(self, index):
+        """Посты идут по времени в порядке ключей, как в живой базе."""
+        return START + SPAN * (index / max(len(self.post_ids), 1))
+
+    @staticmethod
+    def _db_date(value):
+        return connection.ops.adapt_datetimefield_value(value)
+
+    def _text(self, low, high):
+        return ' '.join(self.rnd.choices(
+            WORDS, k=self.rnd.randint(low, high))).capitalize()
+
+    def _users(self):
+        password = make_password(None)
+        joined = self._db_date(START - timedelta(days=1))
+        for pk in self.user_ids:
+            yield (pk, password, False, f'user{pk}', 'Пользователь', str(pk),
+                   '', False, True, joined)
+
+    def _groups(self):
+        for pk in self.group_ids:
+            yield pk, f'Группа {pk}', f'group-{pk}', self._text(5, 20)
+
+    def _posts(self):
+        for start in range(0, len(self.post_ids), self.batch_size):
+            chunk = self.post_ids[start:start + self.batch_size]
+            authors = self._authors(len(chunk))
+            for index, (pk, author_id) in enumerate(zip(chunk, authors),
+                                                    start):
+                group_id = (self.rnd.choice(self.group_ids)
+                            if self.group_ids and self.rnd.random() < 0.7
+                            else None)
+                with_image = self.rnd.random() < self.image_ratio
+                image = (self.rnd.choice(self.images)
+                         if self.images and with_image else '')
+                yield (pk, self._text(5, 60),
+                       self._db_date(self._post_date(index)),
+                       author_id, group_id, image, '')
+
+    def _comments(self, count):
+        if not self.post_ids:
+            return
+        for _ in range(count):
+            index = self.rnd.randrange(len(self.post_ids))
+            created = self._post_date(index) + timedelta(
+                seconds=self.rnd.randrange(3 * 24 * 3600))
+            yield (self.post_ids[index], self.rnd.choice(self.user_ids),
+                   self._text(2, 20), self._db_date(created))
+
+    def _follows(self, count):
+        """Подписчики равномерны, авторы — по тому же закону Ципфа,
+        поэтому у популярных авторов много подписчиков."""
+        mean = count / len(self.user_ids)
+        if not mean:
+            return
+        limit = len(self.user_ids) - 1
+        for user_id in self.user_ids:
+            degree = min(limit, int(self.rnd.expovariate(1 / mean)))
+            authors = set()
+            for _ in range(10):
+                if len(authors) >= degree:
+                    break
+                authors.update(
+                    author for author in self._authors(degree - len(authors))
+                    if author != user_id)
+            while len(authors) < degree:
+                # хвост распределения добираем равномерно
+                author = self.rnd.choice(self.user_ids)
+                if author != user_id:
+                    authors.add(author)
+            for author_id in sorted(authors):
+                yield user_id, author_id
+
+    def _insert(self, label, model, fields, rows, after_batch=None):
+        """Вставляет строки пачками по batch_size, каждая в своей
+        транзакции.
+
+        Вместо bulk_create — executemany одного подготовленного INSERT:
+        Django 2.2 в SQLite дробит bulk_create на запросы по 999
+        параметров и тратит большую часть времени на их компиляцию.
+        Сигналы не вызываются, производные данные строятся в конце.
+        """
+        columns = ', '.join(
+            model._meta.get_field(name).column for name in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        sql = (f'INSERT INTO {model._meta.db_table} ({columns}) '
+               f'VALUES ({placeholders})')
+        total = 0
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+                if after_batch is not None:
+                    after_batch(batch)
+            total += len(batch)
+        self._log(f'{label}: {total}')
+
+    @staticmethod
+    def _index(posts):
+        get_backend().index_many((post[0], post[1]) for post in posts)
+
+    def _fill_timeline(self):
+        """Раскладывает посты по лентам подписчиков одним INSERT ... SELECT,
+        как это сделал бы fan_out_post для каждого поста."""
+        push_authors = (
+            Follow.objects.filter(author_id__gte=self.user_ids[0],
+                                  author_id__lte=self.user_ids[-1])
+            .values('author').annotate(total=Count('pk'))
+            .filter(total__lte=fanout_limit()).values('author')
+        )
+        sql, params = push_authors.query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {TimelineEntry._meta.db_table} '
+                '(user_id, post_id, pub_date) '
+                f'SELECT f.user_id, p.id, p.pub_date '
+                f'FROM {Follow._meta.db_table} f '
+                f'JOIN {Post._meta.db_table} p ON p.author_id = f.author_id '
+                f'WHERE f.author_id IN ({sql})', params)
+            self._log(f'записи лент: {cursor.rowcount}')
+
+    def _recount(self):
+        for start in range(0, len(self.user_ids), self.batch_size):
+            recount(self.user_ids[start:start + self.batch_size])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.timeline import rebalance
+
+
+class Command(BaseCommand):
+    help = ('Переводит популярных авторов в чтение при показе ленты '
+            'подписок и возвращает к раскладке тех, у кого подписчиков '
+            'стало меньше; запускается по расписанию, например из cron')
+
+    def handle(self, *args, **options):
+        pulled, pushed = rebalance()
+        self.stdout.write(f'В pull: {pulled}, в push: {pushed}')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core import writes
+from posts.trending import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Заново считает ленту «Обсуждаемое» по недавним комментариям; '
+            'нужна после загрузки комментариев в обход сигналов')
+
+    def handle(self, *args, **options):
+        saved = writes.with_retries('posts.trending.rebuild', rebuild)
+        self.stdout.write(f'Сохранено оценок: {saved}')
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import writes
+from posts.recommender import drop_stale, load_graph, run, save
+from posts.suggestions import POPULAR_KEY, forget
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рекомендации подписок по графу Follow; '
+            'запускается по расписанию, например из cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='сколько пользователей считать за раз')
+        parser.add_argument(
+            '--limit', type=int, default=settings.SUGGESTIONS_STORED,
+            help='сколько авторов хранить для каждого пользователя')
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        graph = load_graph()
+        users = run(
+            graph, options['limit'], options['chunk_size'],
+            lambda rows: forget(
+                writes.with_retries('posts.recommender', save, rows)))
+        dropped = writes.with_retries(
+            'posts.recommender', drop_stale, started)
+        forget(dropped)
+        cache.delete(POPULAR_KEY)
+        self.stdout.write(f'Пользователей с рекомендациями: {users}, '
+                          f'удалено устаревших: {len(dropped)}')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core import writes
+from posts.counts import reconcile
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики постов и комментариев с таблицами; '
+            'запускается по расписанию, например из cron')
+
+    def handle(self, *args, **options):
+        fixed = writes.with_retries('posts.counts.reconcile', reconcile)
+        self.stdout.write(f'Исправлено счётчиков: {fixed}')
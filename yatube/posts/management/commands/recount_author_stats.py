@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import User
+from posts.stats import recount
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов и подписок авторов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        author_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        total = 0
+        batch = []
+        for pk in author_ids.iterator():
+            batch.append(pk)
+            if len(batch) == batch_size:
+                recount(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            recount(batch)
+            total += len(batch)
+        self.stdout.write(f'Пересчитано авторов: {total}')
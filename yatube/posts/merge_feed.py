@@ -0,0 +1,94 @@
+"""Лента подписок, собранная при чтении (pull-модель).
+
+Для каждого автора, на которого подписан пользователь, берутся
+FEED_MERGE_RECENT новейших ключей постов (pub_date, id): из кеша
+недавних постов автора или поиском по индексу (author, -pub_date).
+Потоки авторов сливаются кучей, и поток дочитывается из базы, только
+когда слияние до него дошло, поэтому первая страница при тысячах
+подписок не читает все посты этих авторов.
+"""
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .follow_graph import following_ids
+from .models import Post
+from .paginator import (AMOUNT_OF_POSTS, CursorPage, decode_cursor,
+                        encode_key)
+from .seek import seek_many
+
+RECENT_KEY = 'posts:recent:{}'
+
+
+def recent_size():
+    return getattr(settings, 'FEED_MERGE_RECENT', 20)
+
+
+def forget(author_id):
+    """Сбрасывает кеш недавних постов автора после коммита записи.
+
+    Сброшенный раньше, кеш успел бы заново заполнить читатель,
+    который ещё не видит незакоммиченный пост.
+    """
+    key = RECENT_KEY.format(author_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def _heads(author_ids, after):
+    """Первая порция ключей каждого автора и признак, что дальше
+    постов нет: из кеша, а недостающие — из базы."""
+    size = recent_size()
+    cached = cache.get_many([RECENT_KEY.format(pk) for pk in author_ids])
+    heads = {}
+    cold = []
+    for author_id in author_ids:
+        recent = cached.get(RECENT_KEY.format(author_id))
+        if recent is None:
+            cold.append(author_id)
+            continue
+        keys = [key for key in recent if after is None or key < after]
+        complete = len(recent) < size
+        if keys or complete:
+            heads[author_id] = (keys, complete)
+        else:
+            cold.append(author_id)
+    found = seek_many(cold, after, size)
+    if after is None:
+        cache.set_many({RECENT_KEY.format(author_id): keys
+                        for author_id, keys in found.items()},
+                       settings.FEED_CACHE_TIMEOUT)
+    for author_id, keys in found.items():
+        heads[author_id] = (keys, len(keys) < size)
+    return heads
+
+
+def _stream(author_id, keys, complete):
+    """Ключи постов автора от новых к старым, дочитываемые по мере
+    того, как их забирает слияние."""
+    while keys:
+        yield from keys
+        if complete:
+            return
+        keys = seek_many([author_id], keys[-1], recent_size())[author_id]
+        complete = len(keys) < recent_size()
+
+
+def merged_page(user, cursor=None, per_page=AMOUNT_OF_POSTS):
+    """Страница ленты подписок после курсора `cursor`."""
+    after = decode_cursor(cursor) if cursor else None
+    author_ids = list(following_ids(user))
+    streams = [_stream(author_id, *head)
+               for author_id, head in _heads(author_ids, after).items()]
+    keys = list(islice(heapq.merge(*streams, reverse=True), per_page + 1))
+    has_next = len(keys) > per_page
+    keys = keys[:per_page]
+    posts = Post.objects.feed_cards().in_bulk([pk for _, pk in keys])
+    return CursorPage(
+        # пост могли удалить после того, как его ключ попал в кеш
+        [posts[pk] for _, pk in keys if pk in posts],
+        next_cursor=(encode_key(keys[-1][0].isoformat(), keys[-1][1])
+                     if has_next else None),
+    )
@@ -0,0 +1,94 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:29
+
+import re
+
+from django.db import migrations
+
+# Копия стеммера из posts.search на момент миграции: правка или
+# переименование живого кода не должны менять её результат.
+WORD = re.compile(r'\w+')
+CYRILLIC = re.compile(r'[а-я]')
+
+# Стеммер Портера для русского языка.
+RVRE = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|((?<=[ая])(ла|на|ете|'
+    r'йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    r'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+DERIVATIONAL_SUFFIX = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+def stem(word):
+    """Основа русского слова; остальные слова возвращаются как есть."""
+    word = word.lower().replace('ё', 'е')
+    match = RVRE.match(word)
+    if not CYRILLIC.search(word) or not match:
+        return word
+    prefix, rv = match.groups()
+    temp = PERFECTIVE_GERUND.sub('', rv, 1)
+    if temp == rv:
+        rv = REFLEXIVE.sub('', rv, 1)
+        temp = ADJECTIVE.sub('', rv, 1)
+        if temp != rv:
+            rv = PARTICIPLE.sub('', temp, 1)
+        else:
+            temp = VERB.sub('', rv, 1)
+            rv = NOUN.sub('', rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+    rv = re.sub('и$', '', rv, 1)
+    if DERIVATIONAL.match(rv):
+        rv = DERIVATIONAL_SUFFIX.sub('', rv, 1)
+    temp = re.sub('ь$', '', rv, 1)
+    if temp == rv:
+        rv = re.sub('нн$', 'н', SUPERLATIVE.sub('', rv, 1), 1)
+    else:
+        rv = temp
+    return prefix + rv
+
+
+def stem_text(text):
+    return ' '.join(stem(word) for word in WORD.findall(text))
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_search USING fts5("
+        "body, tokenize='unicode61 remove_diacritics 2')"
+    )
+    rows = [(pk, stem_text(text)) for pk, text in
+            Post.objects.values_list('pk', 'text').iterator()]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO posts_search (rowid, body) VALUES (%s, %s)', rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_comment_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RowCount',
+            fields=[
+                ('scope', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Область')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Строк')),
+            ],
+            options={
+                'verbose_name': 'Счётчик строк',
+            },
+        ),
+    ]
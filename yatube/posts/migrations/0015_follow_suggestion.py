@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0014_row_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowSuggestion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='follow_suggestions', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('authors', models.BinaryField(verbose_name='Авторы')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Рекомендации подписок',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_follow_suggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('hour', 'Час'), ('day', 'День'), ('week', 'Неделя')], max_length=8, verbose_name='Окно')),
+                ('score', models.FloatField(verbose_name='Оценка')),
+                ('post', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='trending_scores', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Оценка обсуждаемости',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='trendingscore',
+            index=models.Index(fields=['window', '-score', '-post'], name='trending_window_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='trendingscore',
+            constraint=models.UniqueConstraint(fields=('post', 'window'), name='trending_post_window_unique'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-18 15:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pull_authors(apps, schema_editor):
+    # до этой миграции авторов сверх порога не раскладывали по лентам
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    limit = getattr(settings, 'TIMELINE_FANOUT_MAX_FOLLOWERS', 10000)
+    AuthorStats.objects.filter(followers_count__gt=limit).update(
+        timeline_mode='pull')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_timeline_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='timeline_mode',
+            field=models.CharField(choices=[('push', 'Раскладываются по лентам'), ('pull', 'Читаются при показе ленты'), ('fill', 'Раскладываются, ленты дозаполняются')], default='push', max_length=4, verbose_name='Лента подписок'),
+        ),
+        migrations.RunPython(mark_pull_authors, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,7 @@
+import json
+
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.db import models
 
 User = get_user_model()
@@ -19,6 +22,17 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def feed_cards(self):
+        """Посты для карточек ленты: автор и группа одним JOIN,
+        только те колонки, которые выводит карточка."""
+        return self.select_related('author', 'group').only(
+            'text', 'pub_date', 'image', 'image_variants', 'author', 'group',
+            'author__username', 'author__first_name', 'author__last_name',
+            'group__slug', 'group__title',
+        )
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст',
@@ -28,32 +42,64 @@ class Post(models.Model):
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
                                related_name='posts',
-                               verbose_name='Автор')
+                               verbose_name='Автор',
+                               db_index=False)
     group: tuple = models.ForeignKey(Group,
                                      verbose_name='Группа',
                                      on_delete=models.CASCADE,
                                      blank=True, null=True,
-                                     related_name='posts')
+                                     related_name='posts',
+                                     db_index=False)
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
         blank=True
     )
+    image_variants = models.TextField(
+        'Варианты картинки',
+        blank=True,
+        editable=False,
+        help_text='JSON с размерами и форматами нарезанной картинки'
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = (
+            models.Index(fields=('author', '-pub_date'),
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=('group', '-pub_date'),
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=('-pub_date', '-id'),
+                         name='post_pub_date_id_idx'),
+        )
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def image_sources(self):
+        """Варианты картинки по MIME-типам для <source srcset>."""
+        if not self.image_variants:
+            return []
+        sources = {}
+        for variant in json.loads(self.image_variants):
+            url = default_storage.url(variant['name'])
+            sources.setdefault(variant['type'], []).append(
+                f'{url} {variant["width"]}w')
+        return [{'type': mime, 'srcset': ', '.join(srcset)}
+                for mime, srcset in sources.items()]
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post,
                              on_delete=models.CASCADE,
                              related_name='comments',
-                             verbose_name='Пост')
+                             verbose_name='Пост',
+                             db_index=False)
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
                                related_name='comments',
@@ -65,6 +111,10 @@ class Comment(models.Model):
     class Meta:
         ordering = ('-created',)
         verbose_name = 'Комментарий'
+        indexes = (
+            models.Index(fields=('post', '-created', '-id'),
+                         name='comment_post_created_idx'),
+        )
 
 
 class Follow(models.Model):
@@ -73,12 +123,129 @@ class Follow(models.Model):
                              related_name='follower')
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
-                               related_name='following')
+                               related_name='following',
+                               db_index=False)
 
     class Meta:
         constraints = (
             models.UniqueConstraint(
                 fields=('user', 'author'),
                 name='user_author_unique',
-            )
+            ),
+        )
+        indexes = (
+            models.Index(fields=('author', 'user'),
+                         name='follow_author_user_idx'),
+        )
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='timeline_entries')
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='timeline_entries')
+    # копия Post.pub_date: лента читается по индексу без JOIN и сортировки
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='timeline_user_post_unique',
+            ),
+        )
+        indexes = (
+            models.Index(fields=('user', '-pub_date', '-post'),
+                         name='timeline_user_pub_date_idx'),
+        )
+
+
+class AuthorStats(models.Model):
+    """Счётчики автора, обновляемые при записи вместо COUNT(*)."""
+
+    # Как посты автора попадают в ленту подписок, см. posts.timeline.
+    PUSH = 'push'
+    PULL = 'pull'
+    FILL = 'fill'
+    TIMELINE_MODES = (
+        (PUSH, 'Раскладываются по лентам'),
+        (PULL, 'Читаются при показе ленты'),
+        (FILL, 'Раскладываются, ленты дозаполняются'),
+    )
+
+    author = models.OneToOneField(User,
+                                  on_delete=models.CASCADE,
+                                  related_name='stats',
+                                  verbose_name='Автор')
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+    timeline_mode = models.CharField('Лента подписок', max_length=4,
+                                     choices=TIMELINE_MODES, default=PUSH)
+
+    class Meta:
+        verbose_name = 'Счётчики автора'
+
+
+class RowCount(models.Model):
+    """Число строк в области вместо COUNT(*): все посты, посты группы,
+    комментарии поста. Ключи строит posts.counts.scope."""
+
+    scope = models.CharField('Область', max_length=64, primary_key=True)
+    count = models.BigIntegerField('Строк', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчик строк'
+
+
+class FollowSuggestion(models.Model):
+    """Авторы, которых стоит предложить пользователю, в порядке
+    убывания оценки. Пересчитывает команда recommend_authors."""
+
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='follow_suggestions',
+                                verbose_name='Пользователь')
+    # id авторов как uint32 little-endian, см. posts.suggestions
+    authors = models.BinaryField('Авторы')
+    updated = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Рекомендации подписок'
+
+
+class TrendingScore(models.Model):
+    """Оценка поста в окне ленты «Обсуждаемое»: логарифм суммы
+    затухающих весов комментариев. Обновляет posts.trending."""
+
+    WINDOWS = (
+        ('hour', 'Час'),
+        ('day', 'День'),
+        ('week', 'Неделя'),
+    )
+
+    window = models.CharField('Окно', max_length=8, choices=WINDOWS)
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='trending_scores',
+                             verbose_name='Пост',
+                             db_index=False)
+    score = models.FloatField('Оценка')
+
+    class Meta:
+        verbose_name = 'Оценка обсуждаемости'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('post', 'window'),
+                name='trending_post_window_unique',
+            ),
+        )
+        indexes = (
+            models.Index(fields=('window', '-score', '-post'),
+                         name='trending_window_score_idx'),
         )
@@ -0,0 +1,239 @@
+import base64
+import binascii
+import inspect
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.inspect import method_has_no_args
+
+from . import counts
+
+AMOUNT_OF_POSTS: int = 10
+AMOUNT_OF_COMMENTS: int = 20
+
+
+def encode_key(*values):
+    """Упаковывает значения ключа сортировки в строку для URL."""
+    raw = '|'.join(map(str, values)).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_key(cursor, parts):
+    """Список из parts строк ключа или None для битого курсора."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    values = raw.rsplit('|', parts - 1)
+    return values if len(values) == parts else None
+
+
+def encode_cursor(obj, field='pub_date'):
+    """Упаковывает ключ (дата, id) объекта в строку для URL."""
+    return encode_key(getattr(obj, field).isoformat(), obj.pk)
+
+
+def decode_cursor(cursor):
+    """Возвращает (дата, id) или None для битого курсора."""
+    values = decode_key(cursor, 2)
+    if values is None:
+        return None
+    try:
+        pub_date = parse_datetime(values[0])
+        pk = int(values[1])
+    except ValueError:
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPage(Sequence):
+    """Страница ленты, полученная поиском по индексу (pub_date, id).
+
+    Не знает ни номера страницы, ни общего числа постов,
+    поэтому не выполняет COUNT(*) и не сканирует OFFSET.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage {self.next_cursor!r}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset-пагинация по (field, id) от новых объектов к старым.
+
+    По умолчанию field — дата публикации поста.
+    """
+
+    def __init__(self, queryset, per_page=AMOUNT_OF_POSTS, field='pub_date'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+
+    def _cursor(self, obj):
+        return encode_cursor(obj, self.field)
+
+    def get_page(self, cursor=None, before=None):
+        """Страница после курсора `cursor` или перед курсором `before`."""
+        if before:
+            key = decode_cursor(before)
+            if key is not None:
+                return self._page_before(*key)
+        key = decode_cursor(cursor) if cursor else None
+        if key is None:
+            return self._page_after()
+        return self._page_after(*key)
+
+    def _page_after(self, date=None, pk=None):
+        field = self.field
+        queryset = self.queryset.order_by(f'-{field}', '-pk')
+        if date is not None:
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': date}) | Q(**{field: date, 'pk__lt': pk})
+            )
+        objects = list(queryset[:self.per_page + 1])
+        has_next = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        return CursorPage(
+            objects,
+            next_cursor=self._cursor(objects[-1]) if has_next else None,
+            previous_cursor=(
+                self._cursor(objects[0]) if date is not None and objects
+                else None
+            ),
+        )
+
+    def _page_before(self, date, pk):
+        field = self.field
+        queryset = self.queryset.order_by(field, 'pk').filter(
+            Q(**{f'{field}__gt': date}) | Q(**{field: date, 'pk__gt': pk})
+        )
+        objects = list(queryset[:self.per_page + 1])
+        has_previous = len(objects) > self.per_page
+        objects = objects[:self.per_page][::-1]
+        return CursorPage(
+            objects,
+            next_cursor=self._cursor(objects[-1]) if objects else None,
+            previous_cursor=(
+                self._cursor(objects[0]) if has_previous else None),
+        )
+
+
+class WindowedPaginator(Paginator):
+    """Paginator, который отдаёт не все номера страниц, а только окно.
+
+    max_pages ограничивает глубину: COUNT(*) считается по подзапросу
+    с LIMIT max_pages * per_page, а страницы дальше недоступны.
+    Объект не из QuerySet считается своим count(limit=...), если он
+    его поддерживает, иначе срезом.
+    """
+
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, *args, max_pages=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, *args, **kwargs)
+        self.max_pages = max_pages
+
+    @cached_property
+    def count(self):
+        if not self.max_pages:
+            return super().count
+        limit = self.max_pages * self.per_page
+        if isinstance(self.object_list, QuerySet):
+            return self.object_list[:limit].count()
+        count = getattr(self.object_list, 'count', None)
+        if (callable(count) and not inspect.isbuiltin(count)
+                and 'limit' in inspect.signature(count).parameters):
+            return count(limit=limit)
+        limited = self.object_list[:limit]
+        count = getattr(limited, 'count', None)
+        if (callable(count) and not inspect.isbuiltin(count)
+                and method_has_no_args(count)):
+            return count()
+        return len(limited)
+
+    @property
+    def is_truncated(self):
+        """Объектов больше, чем помещается в max_pages страниц."""
+        return bool(self.max_pages) and self.num_pages >= self.max_pages
+
+    def get_elided_page_range(self, number=1, *, on_each_side=2, on_ends=1):
+        """Номера страниц: on_ends с краёв и on_each_side вокруг number,
+        пропуски заменены на ELLIPSIS. Как в Django 3.2."""
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > (1 + on_each_side + on_ends) + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < (self.num_pages - on_each_side - on_ends) - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(self.num_pages - on_ends + 1, self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+
+class CountedPaginator(WindowedPaginator):
+    """WindowedPaginator, который берёт число объектов из счётчиков
+    posts.counts, а COUNT(*) выполняет, только если счётчика нет."""
+
+    @cached_property
+    def count(self):
+        total = counts.cached_count(self.object_list)
+        if total is None:
+            return super().count
+        if self.max_pages:
+            return min(total, self.max_pages * self.per_page)
+        return total
+
+
+def paginate(request, queryset, per_page=AMOUNT_OF_POSTS):
+    """Возвращает страницу ленты для запроса.
+
+    Курсорный режим включается параметром `cursor`/`before` в запросе
+    или настройкой POSTS_CURSOR_PAGINATION, иначе используется
+    CountedPaginator с номерами страниц, глубина которого
+    ограничена настройкой POSTS_MAX_PAGES.
+    """
+    cursor = request.GET.get('cursor')
+    before = request.GET.get('before')
+    if cursor or before or getattr(
+            settings, 'POSTS_CURSOR_PAGINATION', False):
+        return CursorPaginator(queryset, per_page).get_page(cursor, before)
+    paginator = CountedPaginator(
+        queryset, per_page,
+        max_pages=getattr(settings, 'POSTS_MAX_PAGES', None))
+    return paginator.get_page(request.GET.get('page'))
@@ -0,0 +1,172 @@
+"""Расчёт рекомендаций подписок по графу Follow.
+
+Граф загружается в CSR-матрицу смежности A (строка — пользователь,
+столбцы — авторы, на которых он подписан) и транспонированную к ней.
+Для пачки пользователей U оценка автора b складывается из:
+
+* друзей друзей — строки A[U]·A: на b подписаны авторы, которых
+  читает пользователь;
+* совместных подписок — A[U]·Aᵀ даёт похожих читателей (сколько
+  общих авторов), их подписки с этими весами — строки (A[U]·Aᵀ)·A.
+
+Произведения считаются векторно: соседи всех узлов пачки собираются
+одним np.repeat, а одинаковые пары (пользователь, автор)
+суммируются через np.unique. Число соседей на узел ограничено,
+поэтому память на пачку не зависит от популярности авторов, а весь
+граф занимает два int32 на подписку.
+"""
+from collections import namedtuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Follow, FollowSuggestion
+from . import suggestions
+
+# Сколько подписок пользователя берётся в расчёт.
+MAX_SEEDS = 200
+# Сколько соседей узла разворачивается на каждом шаге.
+MAX_FANOUT = 100
+# Сколько самых похожих читателей учитывается.
+SIMILAR_USERS = 50
+FOF_WEIGHT = 1.0
+CO_FOLLOW_WEIGHT = 0.5
+
+Graph = namedtuple('Graph', 'indptr indices t_indptr t_indices size')
+
+
+def load_graph(batch_size=100000):
+    """Читает Follow пачками в порядке (user, author) и строит CSR."""
+    size = (Follow.objects.aggregate(last=Max('user'))['last'] or 0) + 1
+    size = max(size, (Follow.objects.aggregate(
+        last=Max('author'))['last'] or 0) + 1)
+    rows = []
+    columns = []
+    edges = Follow.objects.order_by('user', 'author').values_list(
+        'user', 'author')
+    chunk = []
+    for edge in edges.iterator(chunk_size=batch_size):
+        chunk.append(edge)
+        if len(chunk) == batch_size:
+            pairs = np.array(chunk, dtype=np.int32)
+            rows.append(pairs[:, 0])
+            columns.append(pairs[:, 1])
+            chunk = []
+    if chunk:
+        pairs = np.array(chunk, dtype=np.int32)
+        rows.append(pairs[:, 0])
+        columns.append(pairs[:, 1])
+    row = np.concatenate(rows) if rows else np.empty(0, np.int32)
+    indices = np.concatenate(columns) if columns else np.empty(0, np.int32)
+    indptr = _indptr(row, size)
+    order = np.argsort(indices, kind='stable')
+    t_indptr = _indptr(indices[order], size)
+    return Graph(indptr, indices, t_indptr, row[order], size)
+
+
+def _indptr(sorted_rows, size):
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sorted_rows, minlength=size), out=indptr[1:])
+    return indptr
+
+
+def _expand(indptr, indices, owners, nodes, weights, cap):
+    """Соседи nodes по CSR, не больше cap на узел, вместе с
+    владельцем и весом исходного узла."""
+    starts = indptr[nodes]
+    lengths = np.minimum(indptr[nodes + 1] - starts, cap)
+    ends = np.cumsum(lengths)
+    offsets = np.arange(ends[-1] if len(ends) else 0) - np.repeat(
+        ends - lengths, lengths)
+    neighbors = indices[np.repeat(starts, lengths) + offsets]
+    return (np.repeat(owners, lengths), neighbors,
+            np.repeat(weights, lengths))
+
+
+def _sum_pairs(owners, targets, weights, size):
+    """Складывает веса одинаковых пар (владелец, цель)."""
+    keys = owners.astype(np.int64) * size + targets
+    keys, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse.ravel(), weights=weights)
+    return keys // size, keys % size, sums
+
+
+def _top(owners, targets, scores, limit):
+    """Не больше limit лучших целей каждого владельца."""
+    order = np.lexsort((targets, -scores, owners))
+    owners, targets, scores = owners[order], targets[order], scores[order]
+    rank = np.arange(len(owners)) - np.searchsorted(owners, owners)
+    keep = rank < limit
+    return owners[keep], targets[keep], scores[keep]
+
+
+def recommend(graph, users, limit):
+    """Лучшие авторы для каждого из users: список массивов id."""
+    local = np.arange(len(users))
+    ones = np.ones(len(users))
+    owners, seeds, _ = _expand(
+        graph.indptr, graph.indices, local, users, ones, MAX_SEEDS)
+    seed_weights = np.ones(len(seeds))
+    fof = _expand(graph.indptr, graph.indices, owners, seeds,
+                  seed_weights * FOF_WEIGHT, MAX_FANOUT)
+    similar = _expand(graph.t_indptr, graph.t_indices, owners, seeds,
+                      seed_weights, MAX_FANOUT)
+    not_self = similar[1] != users[similar[0]]
+    similar = _top(*_sum_pairs(*(part[not_self] for part in similar),
+                               graph.size), SIMILAR_USERS)
+    co_follow = _expand(graph.indptr, graph.indices, similar[0],
+                        similar[1], similar[2] * CO_FOLLOW_WEIGHT,
+                        MAX_FANOUT)
+    owners, targets, scores = _sum_pairs(
+        *(np.concatenate(parts) for parts in zip(fof, co_follow)),
+        graph.size)
+    followed_owners, followed, _ = _expand(
+        graph.indptr, graph.indices, local, users, ones, graph.size)
+    followed = followed_owners.astype(np.int64) * graph.size + followed
+    keep = ((targets != users[owners])
+            & ~np.isin(owners * graph.size + targets, followed))
+    owners, targets, _ = _top(
+        owners[keep], targets[keep], scores[keep], limit)
+    bounds = np.searchsorted(owners, local, side='right')
+    return np.split(targets, bounds[:-1])
+
+
+def run(graph, limit, chunk_size, store):
+    """Считает рекомендации пачками по chunk_size пользователей и
+    передаёт каждую пачку в store([(user_id, ids), ...])."""
+    users = np.flatnonzero(np.diff(graph.indptr))
+    for start in range(0, len(users), chunk_size):
+        chunk = users[start:start + chunk_size]
+        store(list(zip(chunk.tolist(), recommend(graph, chunk, limit))))
+    return len(users)
+
+
+def save(rows):
+    """Заменяет рекомендации пользователей пачки.
+
+    Пачка — отрезок id по возрастанию; у пропущенных в нём
+    пользователей нет подписок, и их старые рекомендации тоже
+    удаляются. Возвращает id пользователей, чей кеш надо сбросить
+    после коммита.
+    """
+    old = FollowSuggestion.objects.filter(
+        user_id__gte=rows[0][0], user_id__lte=rows[-1][0])
+    with transaction.atomic():
+        changed = {user_id for user_id, _ in rows}
+        changed.update(old.values_list('user_id', flat=True))
+        old.delete()
+        FollowSuggestion.objects.bulk_create(
+            FollowSuggestion(user_id=user_id,
+                             authors=suggestions.pack(ids.tolist()))
+            for user_id, ids in rows if len(ids))
+    return changed
+
+
+def drop_stale(started):
+    """Удаляет рекомендации тех, кого не было в последнем расчёте,
+    и возвращает их id."""
+    stale = FollowSuggestion.objects.filter(updated__lt=started)
+    user_ids = list(stale.values_list('user_id', flat=True))
+    stale.delete()
+    return user_ids
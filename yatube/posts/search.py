@@ -0,0 +1,184 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Post
+from .paginator import AMOUNT_OF_POSTS, CursorPage, decode_key, encode_key
+
+WORD = re.compile(r'\w+')
+CYRILLIC = re.compile(r'[а-я]')
+
+# Стеммер Портера для русского языка.
+RVRE = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|((?<=[ая])(ла|на|ете|'
+    r'йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    r'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+DERIVATIONAL_SUFFIX = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    """Основа русского слова; остальные слова возвращаются как есть."""
+    word = word.lower().replace('ё', 'е')
+    match = RVRE.match(word)
+    if not CYRILLIC.search(word) or not match:
+        return word
+    prefix, rv = match.groups()
+    temp = PERFECTIVE_GERUND.sub('', rv, 1)
+    if temp == rv:
+        rv = REFLEXIVE.sub('', rv, 1)
+        temp = ADJECTIVE.sub('', rv, 1)
+        if temp != rv:
+            rv = PARTICIPLE.sub('', temp, 1)
+        else:
+            temp = VERB.sub('', rv, 1)
+            rv = NOUN.sub('', rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+    rv = re.sub('и$', '', rv, 1)
+    if DERIVATIONAL.match(rv):
+        rv = DERIVATIONAL_SUFFIX.sub('', rv, 1)
+    temp = re.sub('ь$', '', rv, 1)
+    if temp == rv:
+        rv = re.sub('нн$', 'н', SUPERLATIVE.sub('', rv, 1), 1)
+    else:
+        rv = temp
+    return prefix + rv
+
+
+def stem_text(text):
+    return ' '.join(stem(word) for word in WORD.findall(text))
+
+
+class LikeBackend:
+    """Запасной поиск через LIKE для баз без FTS5."""
+
+    def index(self, post):
+        pass
+
+    def index_many(self, rows):
+        pass
+
+    def remove(self, post_id):
+        pass
+
+    def filter(self, queryset, query):
+        return queryset.filter(text__icontains=query)
+
+    def search(self, query, after=None, limit=AMOUNT_OF_POSTS):
+        """Список (id, ранг) после ключа after в порядке выдачи."""
+        queryset = self.filter(Post.objects.all(), query).order_by('-pk')
+        if after is not None:
+            queryset = queryset.filter(pk__lt=after[1])
+        return [(pk, -pk) for pk in
+                queryset.values_list('pk', flat=True)[:limit]]
+
+
+class FTS5Backend:
+    """Полнотекстовый поиск по таблице FTS5 posts_search с BM25."""
+
+    table = 'posts_search'
+
+    @staticmethod
+    def _connection(write=False):
+        """Соединение, выбранное роутером: чтение может уйти на
+        реплику, поддержка индекса — только в основную базу."""
+        if write:
+            return connections[router.db_for_write(Post)]
+        return connections[router.db_for_read(Post)]
+
+    @staticmethod
+    def match_expression(query):
+        terms = [stem(word) for word in WORD.findall(query)]
+        return ' '.join(f'"{term}"*' for term in terms if term)
+
+    def index(self, post):
+        with self._connection(write=True).cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid = %s', (post.pk,))
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, body) VALUES (%s, %s)',
+                (post.pk, stem_text(post.text)))
+
+    def index_many(self, rows):
+        """Индексирует пары (id, текст) новых постов пачкой."""
+        with self._connection(write=True).cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, body) VALUES (%s, %s)',
+                [(pk, stem_text(text)) for pk, text in rows])
+
+    def remove(self, post_id):
+        with self._connection(write=True).cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid = %s', (post_id,))
+
+    def filter(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s',
+            (expression,)))
+
+    def search(self, query, after=None, limit=AMOUNT_OF_POSTS):
+        """Список (id, ранг bm25) после ключа after, лучшие первыми."""
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        sql = (f'SELECT rowid, rank FROM {self.table} '
+               f'WHERE {self.table} MATCH %s')
+        params = [expression]
+        if after is not None:
+            sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+            params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY rank, rowid LIMIT %s'
+        params.append(limit)
+        with self._connection().cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.POSTS_SEARCH_BACKEND)()
+
+
+def search_page(query, cursor=None, per_page=AMOUNT_OF_POSTS):
+    """Страница результатов поиска с курсором на следующую."""
+    after = None
+    if cursor:
+        values = decode_key(cursor, 2)
+        try:
+            after = (float(values[0]), int(values[1])) if values else None
+        except ValueError:
+            after = None
+    hits = get_backend().search(query, after, per_page + 1)
+    has_next = len(hits) > per_page
+    hits = hits[:per_page]
+    posts = Post.objects.feed_cards().in_bulk([pk for pk, _ in hits])
+    if has_next:
+        last_pk, last_rank = hits[-1]
+        next_cursor = encode_key(last_rank, last_pk)
+    else:
+        next_cursor = None
+    return CursorPage(
+        [posts[pk] for pk, _ in hits if pk in posts],
+        next_cursor=next_cursor,
+    )
@@ -0,0 +1,62 @@
+"""Поиск ключей постов (pub_date, id) автора по индексу
+(author, -pub_date): по одному поиску с LIMIT на автора, многие авторы
+в одном запросе. Нужен лентам, которые сливают потоки авторов."""
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connections, router
+
+from .models import Post
+
+# Авторов в одном UNION ALL: SQLite допускает до 500 частей.
+SEEK_CHUNK = 200
+
+
+def _to_datetime(value):
+    # datetime.fromisoformat в разы быстрее конвертера Django, а строк
+    # здесь тысячи; база хранит время в UTC
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if settings.USE_TZ and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _seek_sql(after):
+    meta = Post._meta
+    author = meta.get_field('author').column
+    pub_date = meta.get_field('pub_date').column
+    pk = meta.pk.column
+    where = f'{author} = %s'
+    if after is not None:
+        where += (f' AND ({pub_date} < %s'
+                  f' OR ({pub_date} = %s AND {pk} < %s))')
+    return (f'SELECT * FROM (SELECT {author}, '
+            f'CAST({pub_date} AS TEXT), {pk} '
+            f'FROM {meta.db_table} WHERE {where} '
+            f'ORDER BY {pub_date} DESC, {pk} DESC LIMIT %s)')
+
+
+def seek_many(author_ids, after, limit):
+    """До limit ключей каждого автора старше after, от новых к старым:
+    один поиск по индексу на автора, по SEEK_CHUNK авторов в запросе."""
+    found = {author_id: [] for author_id in author_ids}
+    connection = connections[router.db_for_read(Post)]
+    if after is not None:
+        date = connection.ops.adapt_datetimefield_value(after[0])
+        tail = [date, date, after[1], limit]
+    else:
+        tail = [limit]
+    part = _seek_sql(after)
+    with connection.cursor() as cursor:
+        for start in range(0, len(author_ids), SEEK_CHUNK):
+            chunk = author_ids[start:start + SEEK_CHUNK]
+            params = []
+            for author_id in chunk:
+                params += [author_id, *tail]
+            cursor.execute(' UNION ALL '.join([part] * len(chunk)), params)
+            for author_id, pub_date, pk in cursor.fetchall():
+                found[author_id].append((_to_datetime(pub_date), pk))
+    for keys in found.values():
+        keys.sort(reverse=True)
+    return found
@@ -0,0 +1,59 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import (counts, feed_cache, follow_graph, merge_feed, stats, timeline,
+               trending)
+from .search import get_backend
+from .models import Comment, Follow, Post
+
+
+@receiver(post_init, sender=Post)
+@receiver(post_init, sender=Comment)
+def counted_loaded(sender, instance, **kwargs):
+    counts.remember(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+def counted_saved(sender, instance, created, **kwargs):
+    counts.saved(instance, created)
+
+
+@receiver(post_delete, sender=Post)
+def counted_deleted(sender, instance, **kwargs):
+    counts.deleted(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    feed_cache.bump_feed_generation()
+    get_backend().index(instance)
+    if created:
+        stats.bump(instance.author_id, 'posts_count', 1)
+        timeline.fan_out_post(instance)
+        merge_feed.forget(instance.author_id)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    feed_cache.bump_feed_generation()
+    get_backend().remove(instance.pk)
+    stats.bump(instance.author_id, 'posts_count', -1)
+    merge_feed.forget(instance.author_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        trending.record(instance.post_id, instance.created)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        follow_graph.followed(instance.user_id, (instance.author_id,))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    follow_graph.unfollowed(instance.user_id, (instance.author_id,))
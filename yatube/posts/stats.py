@@ -0,0 +1,72 @@
+from django.db.models import Count, F
+
+from .models import AuthorStats, Follow, Post
+
+BATCH_SIZE: int = 500
+
+
+def _counts(author_ids):
+    """Настоящие значения счётчиков для пачки авторов."""
+    counts = {pk: {'posts_count': 0, 'followers_count': 0,
+                   'following_count': 0} for pk in author_ids}
+    aggregates = (
+        ('posts_count', Post.objects.filter(author_id__in=author_ids)
+         .values('author').annotate(total=Count('pk'))),
+        ('followers_count', Follow.objects.filter(author_id__in=author_ids)
+         .values('author').annotate(total=Count('pk'))),
+        ('following_count', Follow.objects.filter(user_id__in=author_ids)
+         .values('user').annotate(total=Count('pk'))),
+    )
+    for field, rows in aggregates:
+        for row in rows.order_by():
+            pk = row.get('author', row.get('user'))
+            counts[pk][field] = row['total']
+    return counts
+
+
+def recount(author_ids):
+    """Пересчитывает счётчики авторов, создавая недостающие строки."""
+    author_ids = list(author_ids)
+    counts = _counts(author_ids)
+    existing = set(AuthorStats.objects.filter(
+        author_id__in=author_ids).values_list('author_id', flat=True))
+    for pk in existing:
+        AuthorStats.objects.filter(author_id=pk).update(**counts[pk])
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(author_id=pk, **counts[pk])
+         for pk in author_ids if pk not in existing),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def bump(author_id, field, delta):
+    """Атомарно сдвигает счётчик автора на delta.
+
+    Строки нет только у новых авторов: при записи она создаётся
+    пересчётом, при удалении (в том числе каскадном вместе с автором)
+    пропускается.
+    """
+    updated = AuthorStats.objects.filter(author_id=author_id).update(
+        **{field: F(field) + delta})
+    if not updated and delta > 0:
+        recount((author_id,))
+
+
+def bump_many(author_ids, field, delta):
+    """bump для многих авторов одним UPDATE."""
+    updated = AuthorStats.objects.filter(author_id__in=author_ids).update(
+        **{field: F(field) + delta})
+    if updated < len(author_ids) and delta > 0:
+        existing = set(AuthorStats.objects.filter(
+            author_id__in=author_ids).values_list('author_id', flat=True))
+        recount(pk for pk in author_ids if pk not in existing)
+
+
+def get_stats(author):
+    """Счётчики автора, при отсутствии строки считаются один раз."""
+    try:
+        return author.stats
+    except AuthorStats.DoesNotExist:
+        recount((author.pk,))
+        return AuthorStats.objects.get(author=author)
@@ -0,0 +1,77 @@
+"""Кого предложить в подписки: чтение готовых рекомендаций.
+
+Рекомендации считает команда recommend_authors (posts.recommender),
+а здесь только читается строка FollowSuggestion пользователя; она
+кешируется, и команда сбрасывает кеш пересчитанных пользователей.
+Тем, для кого строки нет, предлагаются авторы с наибольшим числом
+подписчиков.
+"""
+import sys
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .follow_graph import following_many
+from .models import AuthorStats, FollowSuggestion, User
+
+POPULAR_KEY = 'posts:popular_authors'
+SUGGESTED_KEY = 'posts:suggested:{}'
+SUGGESTIONS_SHOWN: int = 5
+
+
+def pack(author_ids):
+    ids = array('I', author_ids)
+    if sys.byteorder == 'big':
+        ids.byteswap()
+    return ids.tobytes()
+
+
+def unpack(data):
+    ids = array('I')
+    ids.frombytes(bytes(data))
+    if sys.byteorder == 'big':
+        ids.byteswap()
+    return ids
+
+
+def forget(user_ids):
+    """Сбрасывает кеш рекомендаций пользователей после пересчёта."""
+    cache.delete_many([SUGGESTED_KEY.format(pk) for pk in user_ids])
+
+
+def stored_ids(user_id):
+    """Готовые рекомендации пользователя или None, если их нет."""
+    def load():
+        # b'' — строки нет, чтобы не искать её на каждом запросе
+        return FollowSuggestion.objects.filter(user_id=user_id).values_list(
+            'authors', flat=True).first() or b''
+    stored = cache.get_or_set(SUGGESTED_KEY.format(user_id), load,
+                              settings.FEED_CACHE_TIMEOUT)
+    return unpack(stored) if stored else None
+
+
+def popular_ids():
+    """Самые популярные авторы, список живёт в кеше."""
+    return cache.get_or_set(POPULAR_KEY, lambda: list(
+        AuthorStats.objects.filter(followers_count__gt=0)
+        .order_by('-followers_count', 'author_id')
+        .values_list('author_id', flat=True)[:settings.SUGGESTIONS_STORED]
+    ), settings.FEED_CACHE_TIMEOUT)
+
+
+def suggested_authors(user, limit=SUGGESTIONS_SHOWN, exclude=()):
+    """Авторы для блока «Кого почитать», без тех, на кого user уже
+    подписан."""
+    if not user.is_authenticated:
+        return []
+    ids = stored_ids(user.pk)
+    if ids is None:
+        ids = popular_ids()
+    skip = following_many(user, ids) | {user.pk, *exclude}
+    ids = [pk for pk in ids if pk not in skip][:limit]
+    if not ids:
+        return []
+    authors = User.objects.only(
+        'username', 'first_name', 'last_name').in_bulk(ids)
+    return [authors[pk] for pk in ids if pk in authors]
@@ -0,0 +1,23 @@
+from django import template
+
+from posts.paginator import encode_cursor
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/page_links.html')
+def page_links(page_obj, on_each_side=2, on_ends=1):
+    """Ссылки на первую, последнюю и соседние с текущей страницы."""
+    paginator = page_obj.paginator
+    deeper = None
+    if (paginator.is_truncated and not page_obj.has_next()
+            and page_obj.object_list):
+        # дальше max_pages пускаем только курсором, без OFFSET
+        deeper = encode_cursor(page_obj[len(page_obj) - 1])
+    return {
+        'page_obj': page_obj,
+        'page_range': paginator.get_elided_page_range(
+            page_obj.number, on_each_side=on_each_side, on_ends=on_ends),
+        'ellipsis': paginator.ELLIPSIS,
+        'deeper_cursor': deeper,
+    }
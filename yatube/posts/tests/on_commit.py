@@ -0,0 +1,20 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def run_on_commit():
+    """Выполняет после блока колбэки transaction.on_commit из него.
+
+    TestCase держит каждый тест в транзакции, которая не коммитится,
+    поэтому иначе такие колбэки в тестах не запускаются.
+    """
+    start = len(connection.run_on_commit)
+    try:
+        yield
+    finally:
+        callbacks = connection.run_on_commit[start:]
+        del connection.run_on_commit[start:]
+    for _, callback in callbacks:
+        callback()
@@ -0,0 +1,83 @@
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connection
+
+# Максимум SQL-запросов на один запрос к странице, по имени URL.
+# Сессия и пользователь авторизованного клиента уже учтены.
+QUERY_BUDGETS = {
+    'posts:index': 4,
+    'posts:trending': 4,
+    'posts:group_list': 5,
+    'posts:profile': 10,
+    'posts:post_detail': 6,
+    'posts:post_comments': 1,
+    'posts:search': 4,
+    'posts:post_create': 2,
+    'posts:add_comment': 3,
+    'posts:post_edit': 4,
+    'posts:follow_index': 8,
+    'posts:profile_follow': 12,
+    'posts:profile_unfollow': 9,
+    'posts:profile_follow_many': 2,
+}
+
+
+def _query_origin():
+    """Строка шаблона, при отрисовке которой выполнен запрос."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            origin = getattr(node, 'origin', None)
+            if token is not None and origin is not None:
+                return f'{origin.template_name}:{token.lineno}'
+        frame = frame.f_back
+    return 'view'
+
+
+class QueryRecorder:
+    """Запоминает SQL запросов вместе с местом в шаблоне."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((_query_origin(), sql))
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def report(self):
+        grouped = defaultdict(list)
+        for origin, sql in self.queries:
+            grouped[origin].append(sql)
+        lines = []
+        for origin, statements in grouped.items():
+            lines.append(f'{origin}: {len(statements)}')
+            lines.extend(f'    {sql}' for sql in statements)
+        return '\n'.join(lines)
+
+
+@contextmanager
+def query_budget(max_queries, label='block'):
+    """Падает, если внутри блока выполнено больше max_queries запросов.
+
+    Можно использовать и как декоратор теста.
+    """
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder
+    if len(recorder) > max_queries:
+        raise AssertionError(
+            f'{label}: {len(recorder)} запросов при лимите {max_queries}\n'
+            f'{recorder.report()}'
+        )
+
+
+def url_budget(url_name):
+    """Бюджет запросов для страницы из QUERY_BUDGETS."""
+    return query_budget(QUERY_BUDGETS[url_name], url_name)
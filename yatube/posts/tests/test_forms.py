@@ -1,13 +1,22 @@
+import os
 import shutil
 import tempfile
+from io import BytesIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.db import OperationalError
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
 from posts.forms import PostForm
 from posts.models import Comment, Post
+from posts.images import build_variants, supported_formats
+from posts.thumbnails import generate_thumbnails, store_variants
+from PIL import Image
 
 User = get_user_model()
 
@@ -89,6 +98,100 @@ class PostFormTests(TestCase):
         self.assertEqual(Post.objects.count(), post_count)
         self.assertEqual(Post.objects.get(id=self.post.id), post_id)
 
+    def test_thumbnails_generated_before_render(self):
+        post = Post.objects.create(
+            text='Тестовый текст',
+            author=self.author,
+            image=SimpleUploadedFile('thumb.gif', self.small_gif,
+                                     content_type='image/gif'),
+        )
+        generate_thumbnails(post.image.name)
+        thumbnails = [files for _, _, files in os.walk(
+            os.path.join(TEMP_MEDIA_ROOT, 'cache'))]
+        self.assertTrue(any(thumbnails))
+
+    def test_image_variants(self):
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        Image.new('RGB', (2000, 1000), 'red').save(
+            buffer, 'JPEG', exif=exif.tobytes())
+        post = Post.objects.create(
+            text='Тестовый текст',
+            author=self.author,
+            image=SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                                     content_type='image/jpeg'),
+        )
+        variants = build_variants(post.image.name, post.pk)
+        self.assertEqual(
+            len(variants),
+            len(settings.IMAGE_VARIANT_WIDTHS) * len(supported_formats()))
+        for variant in variants:
+            with default_storage.open(variant['name']) as variant_file:
+                image = Image.open(variant_file)
+                self.assertEqual(image.size,
+                                 (variant['width'], variant['height']))
+                self.assertFalse(image.getexif())
+        store_variants(post.pk, variants)
+        response = self.author_client.get(
+            reverse('posts:post_detail', args=(post.pk,)))
+        self.assertContains(response, 'srcset=')
+        self.assertContains(response, '960w')
+
+    def test_small_image_not_upscaled(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1000, 300), 'red').save(buffer, 'PNG')
+        post = Post.objects.create(
+            text='Тестовый текст',
+            author=self.author,
+            image=SimpleUploadedFile('small.png', buffer.getvalue(),
+                                     content_type='image/png'),
+        )
+        variants = build_variants(post.image.name, post.pk)
+        self.assertEqual({variant['width'] for variant in variants}, {480})
+        directory = os.path.dirname(variants[0]['name'])
+        store_variants(post.pk, [])
+        self.assertEqual(default_storage.listdir(directory), ([], []))
+
+
+@override_settings(WRITE_RETRY_DELAY=0, THUMBNAIL_WORKERS=0)
+class PostWriteRetryTests(TransactionTestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_retry_saves_image_once(self):
+        author = User.objects.create_user(username='auth')
+        client = Client()
+        client.force_login(author)
+        save = Post.save
+        attempts = []
+
+        def locked_once(post, *args, **kwargs):
+            save(post, *args, **kwargs)
+            attempts.append(post.pk)
+            if len(attempts) == 1:
+                raise OperationalError('database is locked')
+
+        image = BytesIO()
+        Image.new('RGB', (4, 4)).save(image, 'GIF')
+        with mock.patch.object(Post, 'save', locked_once):
+            client.post(reverse('posts:post_create'), {
+                'text': 'Текст',
+                'image': SimpleUploadedFile(
+                    'retry.gif', image.getvalue(), content_type='image/gif'),
+            })
+        self.assertEqual(len(attempts), 2)
+        post = Post.objects.get()
+        uploads = os.path.join(self.media, 'posts')
+        self.assertEqual(
+            [name for name in os.listdir(uploads)
+             if os.path.isfile(os.path.join(uploads, name))],
+            [os.path.basename(post.image.name)])
+
 
 class CommentFormTests(TestCase):
     @classmethod
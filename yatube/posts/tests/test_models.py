@@ -1,6 +1,17 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, F
 from django.test import TestCase
-from posts.models import Group, Post
+from django.test.utils import CaptureQueriesContext
+from posts.counts import cached_count, scope
+from posts.models import (AuthorStats, Comment, Follow, FollowSuggestion,
+                          Group, Post, RowCount, TimelineEntry)
+from posts.paginator import CountedPaginator
+from posts.suggestions import pack, suggested_authors, unpack
 
 User = get_user_model()
 
@@ -54,3 +65,208 @@ class PostModelTest(TestCase):
         group = PostModelTest.group
         help_text = group._meta.get_field('title').help_text
         self.assertEqual(help_text, 'Дайте короткое название задаче')
+
+
+class AuthorStatsTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='auth')
+        self.follower = User.objects.create_user(username='follower')
+
+    def test_counters_follow_writes(self):
+        post = Post.objects.create(author=self.author, text='Текст')
+        Post.objects.create(author=self.author, text='Текст')
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        stats = AuthorStats.objects.get(author=self.author)
+        self.assertEqual(stats.posts_count, 2)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.follower).following_count, 1)
+        post.delete()
+        follow.delete()
+        stats.refresh_from_db()
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 0)
+
+    def test_recount_command_repairs_drift(self):
+        Post.objects.create(author=self.author, text='Текст')
+        AuthorStats.objects.filter(author=self.author).update(posts_count=7)
+        call_command('recount_author_stats', batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.author).posts_count, 1)
+
+
+class RowCountTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.other = Group.objects.create(title='Другая', slug='other')
+
+    def stored(self, model, field=None, value=None):
+        return RowCount.objects.get(scope=scope(model, field, value)).count
+
+    def test_counters_follow_writes(self):
+        post = Post.objects.create(
+            author=self.author, text='Текст', group=self.group)
+        Post.objects.create(author=self.author, text='Текст')
+        Comment.objects.create(post=post, author=self.author, text='Текст')
+        self.assertEqual(self.stored(Post), 2)
+        self.assertEqual(self.stored(Post, 'group', self.group.pk), 1)
+        self.assertEqual(self.stored(Comment, 'post', post.pk), 1)
+        post = Post.objects.get(pk=post.pk)
+        post.group = self.other
+        post.save()
+        self.assertEqual(self.stored(Post, 'group', self.group.pk), 0)
+        self.assertEqual(self.stored(Post, 'group', self.other.pk), 1)
+        post.delete()
+        self.assertEqual(self.stored(Post), 1)
+        self.assertEqual(self.stored(Comment), 0)
+        self.assertFalse(RowCount.objects.filter(
+            scope=scope(Comment, 'post', post.pk)).exists())
+
+    def test_post_comments_deleted_in_one_query(self):
+        queries = []
+        for comments in (10, 100):
+            post = Post.objects.create(author=self.author, text='Текст')
+            for _ in range(comments):
+                Comment.objects.create(
+                    post=post, author=self.author, text='Текст')
+            with CaptureQueriesContext(connection) as captured:
+                post.delete()
+            queries.append(len(captured))
+        self.assertEqual(queries[0], queries[1])
+        self.assertEqual(self.stored(Comment), 0)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_counts_without_count_query(self):
+        Post.objects.create(author=self.author, text='Текст', group=self.group)
+        querysets = (
+            Post.objects.feed_cards().order_by('-pub_date'),
+            Post.objects.filter(group=self.group),
+            self.author.posts.all(),
+        )
+        for queryset in querysets:
+            with self.subTest(query=str(queryset.query)):
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(cached_count(queryset), 1)
+                self.assertNotIn('COUNT(', queries[-1]['sql'])
+        self.assertIsNone(cached_count(Post.objects.filter(text='Текст')))
+        self.assertIsNone(cached_count(Post.objects.distinct()))
+
+    def test_paginator_uses_counter(self):
+        for _ in range(3):
+            Post.objects.create(author=self.author, text='Текст')
+        RowCount.objects.filter(scope=scope(Post)).update(count=25)
+        self.assertEqual(CountedPaginator(Post.objects.all(), 10).num_pages, 3)
+        self.assertEqual(
+            CountedPaginator(Post.objects.filter(text='Текст'), 10).count, 3)
+
+    def test_reconcile_command_repairs_drift(self):
+        post = Post.objects.create(
+            author=self.author, text='Текст', group=self.group)
+        RowCount.objects.filter(scope=scope(Post)).update(count=7)
+        RowCount.objects.filter(
+            scope=scope(Post, 'group', self.group.pk)).delete()
+        Comment.objects.bulk_create(
+            [Comment(post=post, author=self.author, text='Текст')])
+        call_command('reconcile_counts', stdout=StringIO())
+        self.assertEqual(self.stored(Post), 1)
+        self.assertEqual(self.stored(Post, 'group', self.group.pk), 1)
+        self.assertEqual(self.stored(Comment, 'post', post.pk), 1)
+
+
+class RecommendAuthorsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader, self.friend, self.twin, self.far, self.known = (
+            User.objects.create_user(username=name)
+            for name in ('reader', 'friend', 'twin', 'far', 'known'))
+        # reader читает friend и known, friend читает far,
+        # twin читает то же, что reader, и ещё far
+        for user, author in ((self.reader, self.friend),
+                             (self.reader, self.known),
+                             (self.friend, self.far),
+                             (self.friend, self.reader),
+                             (self.twin, self.friend),
+                             (self.twin, self.known),
+                             (self.twin, self.far)):
+            Follow.objects.create(user=user, author=author)
+
+    def recommend(self, **options):
+        call_command('recommend_authors', stdout=StringIO(), **options)
+
+    def stored(self, user):
+        return list(unpack(FollowSuggestion.objects.get(user=user).authors))
+
+    def test_pack_round_trip(self):
+        ids = [1, 70000, 2 ** 32 - 1]
+        self.assertEqual(list(unpack(pack(ids))), ids)
+
+    def test_friends_of_friends_first(self):
+        self.recommend(chunk_size=2)
+        self.assertEqual(self.stored(self.reader)[0], self.far.pk)
+        self.assertNotIn(self.reader.pk, self.stored(self.reader))
+        self.assertNotIn(self.friend.pk, self.stored(self.reader))
+        self.assertFalse(FollowSuggestion.objects.filter(
+            user=self.far).exists())
+
+    def test_recount_replaces_rows(self):
+        self.recommend()
+        self.assertEqual(suggested_authors(self.reader), [self.far])
+        Follow.objects.filter(user=self.friend).delete()
+        Follow.objects.filter(user=self.twin).delete()
+        self.recommend()
+        self.assertFalse(FollowSuggestion.objects.filter(
+            user__in=(self.reader, self.friend, self.twin)).exists())
+        self.assertEqual(suggested_authors(self.reader), [])
+
+    def test_popular_authors_without_row(self):
+        newcomer = User.objects.create_user(username='newcomer')
+        with CaptureQueriesContext(connection) as queries:
+            suggested = suggested_authors(newcomer)
+        self.assertEqual(suggested[0], self.friend)
+        self.assertNotIn(newcomer, suggested)
+        with CaptureQueriesContext(connection) as warm:
+            self.assertEqual(suggested_authors(newcomer), suggested)
+        self.assertLess(len(warm), len(queries))
+
+
+class GenerateDatasetTest(TestCase):
+    def generate(self, **options):
+        options = {'users': 20, 'groups': 3, 'posts': 200, 'comments': 50,
+                   'follows': 60, 'verbosity': 0, **options}
+        call_command('generate_dataset', stdout=StringIO(), **options)
+
+    def snapshot(self):
+        first_user = User.objects.order_by('pk').first().pk
+        return [(author_id - first_user, text) for author_id, text in
+                Post.objects.order_by('pk').values_list('author_id', 'text')]
+
+    def test_counts_and_derived_data(self):
+        self.generate()
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 50)
+        self.assertGreater(Follow.objects.count(), 0)
+        self.assertFalse(Follow.objects.filter(
+            user_id=F('author_id')).exists())
+        self.assertEqual(TimelineEntry.objects.count(), sum(
+            Post.objects.filter(author_id=follow.author_id).count()
+            for follow in Follow.objects.all()))
+        author = Post.objects.first().author
+        self.assertEqual(author.stats.posts_count, author.posts.count())
+        self.assertEqual(list(Post.objects.order_by('pk')),
+                         list(Post.objects.order_by('pub_date')))
+
+    def test_same_seed_gives_same_data(self):
+        self.generate(seed=7)
+        first = self.snapshot()
+        User.objects.all().delete()
+        self.generate(seed=7)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_power_law_authors(self):
+        self.generate(posts=1000)
+        counts = sorted(Post.objects.order_by().values('author').annotate(
+            total=Count('pk')).values_list('total', flat=True), reverse=True)
+        self.assertGreater(counts[0], 1000 / 20 * 3)
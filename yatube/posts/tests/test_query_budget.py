@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from posts import urls
+from posts.models import Comment, Follow, Group, Post
+
+from .query_budget import QUERY_BUDGETS, query_budget, url_budget
+
+User = get_user_model()
+
+POSTS_PER_PAGE = 10
+
+
+class QueryBudgetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='title',
+            slug='slug',
+            description='description',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.post = Post.objects.create(
+            text='text', author=cls.author, group=cls.group)
+        cls.seed(1)
+
+    @classmethod
+    def seed(cls, amount):
+        """Добавляет посты разных авторов и комментарии к cls.post."""
+        for _ in range(amount):
+            author = User.objects.create_user(
+                username=f'author{User.objects.count()}')
+            Follow.objects.create(user=cls.user, author=author)
+            Post.objects.create(text='text', author=author, group=cls.group)
+            Comment.objects.create(post=cls.post, author=author, text='text')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def url_args(self, name):
+        return {
+            'group_list': (self.group.slug,),
+            'profile': (self.author.username,),
+            'post_detail': (self.post.pk,),
+            'post_comments': (self.post.pk,),
+            'add_comment': (self.post.pk,),
+            'post_edit': (self.post.pk,),
+            'profile_follow': (self.user.username,),
+            'profile_unfollow': (self.user.username,),
+        }.get(name, ())
+
+    def measure(self):
+        counts = {}
+        for pattern in urls.urlpatterns:
+            url_name = f'{urls.app_name}:{pattern.name}'
+            url = reverse(url_name, args=self.url_args(pattern.name))
+            cache.clear()
+            with url_budget(url_name) as recorder:
+                self.client.get(url)
+            counts[url_name] = len(recorder)
+        return counts
+
+    def test_every_view_has_budget(self):
+        for pattern in urls.urlpatterns:
+            with self.subTest(name=pattern.name):
+                self.assertIn(f'{urls.app_name}:{pattern.name}', QUERY_BUDGETS)
+
+    def test_queries_do_not_grow_with_data(self):
+        before = self.measure()
+        self.seed(POSTS_PER_PAGE + 1)
+        after = self.measure()
+        for url_name, count in before.items():
+            with self.subTest(url_name=url_name):
+                self.assertEqual(after[url_name], count)
+
+    def test_budget_reports_template_lines(self):
+        with self.assertRaisesMessage(AssertionError, 'posts/index.html:'):
+            with query_budget(0, 'index'):
+                Post.objects.update(text='text')
+                cache.clear()
+                self.client.get(reverse('posts:index'))
@@ -1,19 +1,40 @@
 import shutil
 import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.transaction import TransactionManagementError
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from posts.models import Follow, Group, Post
+from django.utils import timezone
+from posts import feed_cache, follow_graph, trending
+from posts.models import (AuthorStats, Comment, Follow, Group, Post,
+                          TimelineEntry, TrendingScore)
+from posts.paginator import WindowedPaginator
+from posts.search import FTS5Backend
+from posts.timeline import Timeline
+
+from .on_commit import run_on_commit
 
 User = get_user_model()
 
 POSTS_PER_PAGE = 10
 NEXT_PAGE_POSTS = 5
+WINDOWED_PAGES = 15
+COMMENTS_PER_PAGE = 20
+BULK_AUTHORS = 50
+NEXT_PAGE_COMMENTS = 3
+TRENDING_POSTS = 15
+TRENDING_TOP_K = 4
 
 
 class PostPagesTests(TestCase):
@@ -41,8 +62,10 @@ class PostPagesTests(TestCase):
         # cache.clear()
 
     def test_cache_index_page_correct(self):
+        cache.clear()
         response = self.authorized_client.get(reverse('posts:index'))
         post = response.content
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
         response_old_post = self.authorized_client.get(reverse('posts:index'))
         old_post = response_old_post.content
         self.assertEqual(old_post, post)
@@ -51,6 +74,37 @@ class PostPagesTests(TestCase):
         new_post = response_new_post.content
         self.assertNotEqual(old_post, new_post)
 
+    def test_cache_is_page_aware_and_invalidated_on_write(self):
+        cache.clear()
+        for number in range(POSTS_PER_PAGE):
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+        first = self.guest_client.get(reverse('posts:index')).content
+        second = self.guest_client.get(
+            reverse('posts:index'), {'page': 2}).content
+        self.assertNotEqual(first, second)
+        with run_on_commit():
+            post = Post.objects.create(author=self.author, text='Свежий пост')
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, post.text)
+        with run_on_commit():
+            post.delete()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, post.text)
+
+    def test_generation_bumped_after_commit(self):
+        cache.set(feed_cache.GENERATION_KEY, 1, None)
+        cache.set(feed_cache.FOLLOW_GENERATION_KEY.format(self.author.pk),
+                  1, None)
+        with run_on_commit():
+            Post.objects.create(author=self.author, text='Пост')
+            feed_cache.bump_follow_generation(self.author.pk)
+            self.assertEqual(cache.get(feed_cache.GENERATION_KEY), 1)
+            self.assertEqual(cache.get(feed_cache.FOLLOW_GENERATION_KEY
+                                       .format(self.author.pk)), 1)
+        self.assertEqual(cache.get(feed_cache.GENERATION_KEY), 2)
+        self.assertEqual(cache.get(
+            feed_cache.FOLLOW_GENERATION_KEY.format(self.author.pk)), 2)
+
     def test_pages_uses_correct_template(self):
         cache.clear()
         """URL-адрес использует соответствующий шаблон."""
@@ -207,6 +261,305 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(len(object.object_list), NEXT_PAGE_POSTS)
 
 
+class WindowedPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        Post.objects.bulk_create(
+            Post(text='text', author=cls.author)
+            for _ in range(POSTS_PER_PAGE * WINDOWED_PAGES)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_only_window_of_page_links(self):
+        response = self.client.get(reverse('posts:index'), {'page': 8})
+        for page in (1, 6, 7, 9, 10, WINDOWED_PAGES):
+            self.assertContains(response, f'href="?page={page}"')
+        for page in (2, 5, 11, WINDOWED_PAGES - 1):
+            self.assertNotContains(response, f'href="?page={page}"')
+        self.assertContains(response, '…', count=2)
+
+    def test_elided_page_range(self):
+        paginator = WindowedPaginator(range(100), 10)
+        ellipsis = WindowedPaginator.ELLIPSIS
+        self.assertEqual(
+            list(paginator.get_elided_page_range(1)),
+            [1, 2, 3, ellipsis, 10])
+        self.assertEqual(
+            list(paginator.get_elided_page_range(5)),
+            [1, 2, 3, 4, 5, 6, 7, ellipsis, 10])
+        self.assertEqual(
+            list(WindowedPaginator(range(200), 10).get_elided_page_range(10)),
+            [1, ellipsis, 8, 9, 10, 11, 12, ellipsis, 20])
+        self.assertEqual(
+            list(WindowedPaginator(range(50), 10).get_elided_page_range(3)),
+            [1, 2, 3, 4, 5])
+
+    @override_settings(POSTS_MAX_PAGES=5)
+    def test_max_pages(self):
+        response = self.client.get(reverse('posts:index'), {'page': 9})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 5)
+        self.assertEqual(page_obj.paginator.num_pages, 5)
+        self.assertTrue(page_obj.paginator.is_truncated)
+        self.assertNotContains(response, 'href="?page=6"')
+        self.assertContains(response, '?cursor=')
+
+
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        for _ in range(POSTS_PER_PAGE + NEXT_PAGE_POSTS):
+            Post.objects.create(
+                text='text',
+                author=cls.author,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pages(self):
+        first = self.client.get(reverse('posts:index'), {'cursor': '-'})
+        page_obj = first.context['page_obj']
+        self.assertEqual(len(page_obj), POSTS_PER_PAGE)
+        self.assertFalse(page_obj.has_previous())
+        self.assertTrue(page_obj.has_next())
+        second = self.client.get(
+            reverse('posts:index'), {'cursor': page_obj.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(second), NEXT_PAGE_POSTS)
+        self.assertFalse(second.has_next())
+        self.assertEqual(
+            list(page_obj) + list(second),
+            list(Post.objects.order_by('-pub_date', '-pk')),
+        )
+        back = self.client.get(
+            reverse('posts:index'), {'before': second.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back), list(page_obj))
+
+    @override_settings(POSTS_CURSOR_PAGINATION=True)
+    def test_cursor_mode_setting(self):
+        response = self.client.get(
+            reverse('posts:profile', args=(self.author.username,))
+        )
+        page_obj = response.context['page_obj']
+        self.assertTrue(page_obj.is_cursor)
+        self.assertContains(response, f'?cursor={page_obj.next_cursor}')
+
+
+class CommentPagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='text', author=cls.author)
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.author, text=f'text {number}')
+            for number in range(COMMENTS_PER_PAGE + NEXT_PAGE_COMMENTS)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_renders_first_page(self):
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        self.assertTrue(comments.has_next())
+        self.assertContains(
+            response,
+            reverse('posts:post_comments', args=(self.post.pk,))
+            + f'?cursor={comments.next_cursor}',
+        )
+
+    def test_fragment_returns_next_batch(self):
+        first = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        ).context['comments']
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk,)),
+            {'cursor': first.next_cursor},
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        second = response.context['comments']
+        self.assertEqual(len(second), NEXT_PAGE_COMMENTS)
+        self.assertFalse(second.has_next())
+        self.assertNotContains(response, 'data-comments-more')
+        self.assertEqual(
+            list(first) + list(second),
+            list(self.post.comments.order_by('-created', '-pk')),
+        )
+
+    def test_page_size_does_not_grow(self):
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.author, text='text')
+            for _ in range(COMMENTS_PER_PAGE)
+        )
+        cache.clear()
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(url)
+        self.assertEqual(len(after), len(before))
+        self.assertEqual(len(response.context['comments']), COMMENTS_PER_PAGE)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='title',
+            slug='slug',
+            description='description',
+        )
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def add_posts(self, amount):
+        for _ in range(amount):
+            author = User.objects.create_user(
+                username=f'author{User.objects.count()}')
+            Post.objects.create(text='text', author=author, group=self.group)
+
+    def test_feed_queries_do_not_grow_with_posts(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+        )
+        Post.objects.create(text='text', author=self.author, group=self.group)
+        self.add_posts(1)
+        before = [self.count_queries(url) for url in urls]
+        self.add_posts(POSTS_PER_PAGE)
+        after = [self.count_queries(url) for url in urls]
+        self.assertEqual(before, after)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.author, text='text')
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def revalidate(self, client, url, response):
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_return_not_modified(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(
+                    self.revalidate(self.client, url, response).status_code,
+                    304)
+                # точности HTTP-даты не хватает записям в ту же секунду
+                self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_etag_depends_on_viewer(self):
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        self.assertEqual(
+            self.revalidate(self.author_client, url, response).status_code,
+            200)
+
+    def test_writes_change_validators(self):
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        response = self.client.get(url)
+        Comment.objects.create(post=self.post, author=self.author, text='t')
+        self.assertEqual(
+            self.revalidate(self.client, url, response).status_code, 200)
+        index = reverse('posts:index')
+        response = self.client.get(index)
+        self.post.text = 'edited'
+        with run_on_commit():
+            self.post.save()
+        self.assertEqual(
+            self.revalidate(self.client, index, response).status_code, 200)
+
+
+class SearchViewsTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(
+            author=self.author, text='Красивые кошки гуляют по крыше')
+        Post.objects.create(author=self.author, text='Собака спит')
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        ).context['page_obj']
+
+    def test_search_uses_russian_stems(self):
+        self.assertEqual(list(self.search('кошка')), [self.post])
+        self.assertEqual(list(self.search('КРЫШЕЙ')), [self.post])
+        self.assertEqual(list(self.search('')), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.post.text = 'Рыжий кот'
+        self.post.save()
+        self.assertEqual(list(self.search('кошки')), [])
+        self.assertEqual(list(self.search('кот')), [self.post])
+        self.post.delete()
+        self.assertEqual(list(self.search('кот')), [])
+
+    def test_search_keyset_pages(self):
+        for number in range(POSTS_PER_PAGE + NEXT_PAGE_POSTS):
+            Post.objects.create(author=self.author, text=f'кошки {number}')
+        first = self.search('кошки')
+        self.assertEqual(len(first), POSTS_PER_PAGE)
+        second = self.search('кошки', cursor=first.next_cursor)
+        self.assertEqual(len(second), NEXT_PAGE_POSTS + 1)
+        self.assertFalse(set(first) & set(second))
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'кошкам'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.post])
+
+    def test_index_reads_and_writes_through_router(self):
+        backend = FTS5Backend()
+        with mock.patch('posts.search.router') as router:
+            router.db_for_read.return_value = connection.alias
+            router.db_for_write.return_value = connection.alias
+            backend.search('кошка')
+            router.db_for_read.assert_called_once_with(Post)
+            router.db_for_write.assert_not_called()
+            backend.index(self.post)
+            backend.remove(self.post.pk)
+            backend.index_many([(self.post.pk, self.post.text)])
+        self.assertEqual(router.db_for_read.call_count, 1)
+        self.assertEqual(router.db_for_write.call_count, 3)
+
+
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
@@ -286,6 +639,7 @@ class FollowViewsTest(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
         self.author_client = Client()
@@ -318,3 +672,390 @@ class FollowViewsTest(TestCase):
             'posts:profile_unfollow', args=(self.author.username,)))
         response = self.authorized_client.get(reverse('posts:follow_index'))
         self.assertNotContains(response, self.post.text)
+
+    def test_post_fanned_out_to_followers(self):
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=post).exists())
+
+    def test_unfollow_trims_timeline(self):
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', args=(self.author.username,)))
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.user).exists())
+
+    def test_follow_state_answered_from_cache(self):
+        url = reverse('posts:profile', args=(self.author.username,))
+        self.authorized_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url)
+        self.assertTrue(response.context['following'])
+        self.assertFalse(any(Follow._meta.db_table in query['sql']
+                             for query in queries))
+        with run_on_commit():
+            self.authorized_client.get(reverse(
+                'posts:profile_unfollow', args=(self.author.username,)))
+        self.assertFalse(self.authorized_client.get(url).context['following'])
+
+    def test_following_many(self):
+        other = User.objects.create_user(username='other')
+        self.assertEqual(
+            follow_graph.following_many(
+                self.user, [self.author.pk, other.pk, self.user.pk]),
+            {self.author.pk})
+        with run_on_commit():
+            Follow.objects.create(user=self.user, author=other)
+        self.assertEqual(
+            follow_graph.following_many(self.user, [other.pk]), {other.pk})
+        self.assertEqual(follow_graph.following_many(
+            self.client.get(reverse('posts:index')).wsgi_request.user,
+            [self.author.pk]), set())
+
+    def test_following_cache_dropped_after_commit(self):
+        other = User.objects.create_user(username='other')
+        follow_graph.following_ids(self.user)
+        with run_on_commit():
+            follow_graph.follow(self.user, [other.pk])
+            self.assertFalse(follow_graph.is_following(self.user, other.pk))
+        self.assertTrue(follow_graph.is_following(self.user, other.pk))
+
+    def test_follow_requires_write_transaction(self):
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            for change in (follow_graph.follow, follow_graph.unfollow):
+                with self.subTest(change=change.__name__):
+                    with self.assertRaises(TransactionManagementError):
+                        change(self.user, [self.author.pk])
+
+    def test_follow_is_idempotent(self):
+        url = reverse('posts:profile_follow', args=(self.author.username,))
+        for _ in range(2):
+            self.authorized_client.get(url)
+        self.assertEqual(
+            Follow.objects.filter(user=self.user, author=self.author).count(),
+            1)
+        self.assertEqual(self.author.stats.followers_count, 1)
+        self.assertEqual(
+            follow_graph.follow(self.user, [self.author.pk, self.user.pk]),
+            [])
+
+    def bulk(self, authors, action='follow'):
+        return self.authorized_client.post(
+            reverse('posts:profile_follow_many'),
+            {'username': [author.username for author in authors],
+             'action': action})
+
+    def test_bulk_follow_and_unfollow(self):
+        authors = [User.objects.create_user(username=f'bulk{number}')
+                   for number in range(BULK_AUTHORS)]
+        posts = [Post.objects.create(author=author, text='text')
+                 for author in authors]
+        with CaptureQueriesContext(connection) as few:
+            self.bulk(authors[:2])
+        Follow.objects.filter(author__in=authors[:2]).delete()
+        with CaptureQueriesContext(connection) as many:
+            response = self.bulk(authors + [self.author])
+        self.assertRedirects(response, reverse('posts:follow_index'))
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(
+            follow_graph.following_many(
+                self.user, [author.pk for author in authors]),
+            {author.pk for author in authors})
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.user).following_count,
+            BULK_AUTHORS + 1)
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.user, post__in=posts).count(), BULK_AUTHORS)
+        self.bulk(authors, action='unfollow')
+        self.assertEqual(list(self.user.follower.values_list(
+            'author', flat=True)), [self.author.pk])
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.user).following_count, 1)
+        self.assertEqual(authors[0].stats.followers_count, 0)
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.user, post__in=posts).exists())
+
+    def test_suggestions_shown(self):
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.author, author=reader)
+        call_command('recommend_authors', stdout=StringIO())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['suggestions'], [reader])
+        self.assertContains(response, reverse(
+            'posts:profile_follow', args=(reader.username,)))
+        response = self.authorized_client.get(
+            reverse('posts:profile', args=(reader.username,)))
+        self.assertEqual(response.context['suggestions'], [])
+        with run_on_commit():
+            self.authorized_client.get(reverse(
+                'posts:profile_follow', args=(reader.username,)))
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['suggestions'], [])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=0)
+    def test_follow_page_pulls_popular_authors(self):
+        call_command('rebalance_timelines', stdout=StringIO())
+        post = Post.objects.create(author=self.author, text='Популярный пост')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertContains(response, post.text)
+
+
+class TimelineFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.other = User.objects.create_user(username='other')
+        cls.authors = [User.objects.create_user(username=f'author{number}')
+                       for number in range(3)]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.user, author=author)
+        Follow.objects.create(user=cls.other, author=cls.authors[0])
+        for number in range(POSTS_PER_PAGE + NEXT_PAGE_POSTS):
+            Post.objects.create(author=cls.authors[number % 3],
+                                text=f'text {number}')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def expected(self):
+        return list(Post.objects.filter(
+            author__following__user=self.user).order_by('-pub_date', '-pk'))
+
+    def pages(self):
+        pages = []
+        cursor = None
+        while True:
+            page_obj = self.client.get(
+                reverse('posts:follow_index'),
+                {'cursor': cursor} if cursor else {}).context['page_obj']
+            pages.append(list(page_obj))
+            if not page_obj.has_next():
+                return pages
+            cursor = page_obj.next_cursor
+
+    def test_pages_match_join(self):
+        first = AuthorStats.objects.filter(author=self.authors[0])
+        states = (
+            ('push', lambda: None),
+            # посты автора есть и в записях, и в его потоке
+            ('fill', lambda: first.update(timeline_mode=AuthorStats.FILL)),
+            ('pull', lambda: call_command(
+                'rebalance_timelines', stdout=StringIO())),
+        )
+        for state, switch in states:
+            with self.subTest(state=state), override_settings(
+                    TIMELINE_FANOUT_MAX_FOLLOWERS=1,
+                    TIMELINE_FANOUT_RETURN_FOLLOWERS=0):
+                switch()
+                self.assertEqual(first.get().timeline_mode, state)
+                with override_settings(POSTS_CURSOR_PAGINATION=True):
+                    pages = self.pages()
+                self.assertEqual([len(page) for page in pages],
+                                 [POSTS_PER_PAGE, NEXT_PAGE_POSTS])
+                self.assertEqual(sum(pages, []), self.expected())
+        page_obj = self.client.get(
+            reverse('posts:follow_index'), {'page': 2}).context['page_obj']
+        self.assertEqual(page_obj.paginator.count,
+                         POSTS_PER_PAGE + NEXT_PAGE_POSTS)
+        self.assertEqual(list(page_obj), pages[1])
+
+    @override_settings(POSTS_MAX_PAGES=20)
+    def test_count_reads_keys_only(self):
+        with mock.patch.object(Timeline, '_posts', autospec=True,
+                               side_effect=Timeline._posts) as posts:
+            page_obj = self.client.get(
+                reverse('posts:follow_index')).context['page_obj']
+        self.assertEqual(page_obj.paginator.count,
+                         POSTS_PER_PAGE + NEXT_PAGE_POSTS)
+        self.assertEqual([len(call.args[1]) for call in posts.call_args_list],
+                         [POSTS_PER_PAGE])
+
+    def test_entries_read_by_index(self):
+        entries = TimelineEntry.objects.filter(user=self.user).order_by(
+            '-pub_date', '-post_id').values_list('pub_date', 'post_id')[:10]
+        sql, params = entries.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('timeline_user_pub_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=2,
+                       TIMELINE_FANOUT_RETURN_FOLLOWERS=1)
+    def test_rebalance_switches_between_thresholds(self):
+        author = User.objects.create_user(username='rising')
+        third = User.objects.create_user(username='third')
+        old = Post.objects.create(author=author, text='До подписчиков')
+        for user in (self.user, self.other, third):
+            Follow.objects.create(user=user, author=author)
+        entries = TimelineEntry.objects.filter(post__author=author)
+        # подписка сверх порога не чистит ленты на пути запроса
+        self.assertEqual(entries.count(), 3)
+
+        def rebalance():
+            call_command('rebalance_timelines', stdout=StringIO())
+            return AuthorStats.objects.get(author=author).timeline_mode
+
+        self.assertEqual(rebalance(), AuthorStats.PULL)
+        self.assertFalse(entries.exists())
+        post = Post.objects.create(author=author, text='Пока читался')
+        self.assertFalse(entries.exists())
+        # между порогами режим не меняется, отписка ничего не пишет
+        follow_graph.unfollow(third, [author.pk])
+        self.assertFalse(entries.exists())
+        self.assertEqual(rebalance(), AuthorStats.PULL)
+        Follow.objects.filter(user=self.other, author=author).delete()
+        self.assertFalse(entries.exists())
+        self.assertEqual(rebalance(), AuthorStats.PUSH)
+        self.assertEqual(list(entries.order_by('post_id').values_list(
+            'user', 'post', 'pub_date')),
+            [(self.user.pk, old.pk, old.pub_date),
+             (self.user.pk, post.pk, post.pub_date)])
+
+
+@override_settings(FOLLOW_FEED_ENGINE='merge', FEED_MERGE_RECENT=3)
+class MergedFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.authors = [User.objects.create_user(username=f'author{number}')
+                       for number in range(4)]
+        Follow.objects.bulk_create(
+            Follow(user=cls.user, author=author) for author in cls.authors)
+        # первый автор пишет больше остальных: его поток дочитывается
+        for number in range(POSTS_PER_PAGE + NEXT_PAGE_POSTS):
+            Post.objects.create(
+                author=cls.authors[0 if number % 2 else number % 4],
+                text=f'text {number}')
+        Post.objects.create(
+            author=User.objects.create_user(username='stranger'),
+            text='text')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def pages(self):
+        pages = []
+        cursor = None
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            page_obj = self.client.get(
+                reverse('posts:follow_index'), params).context['page_obj']
+            pages.append(list(page_obj))
+            if not page_obj.has_next():
+                return pages
+            cursor = page_obj.next_cursor
+
+    def test_pages_match_join(self):
+        expected = list(Post.objects.filter(
+            author__following__user=self.user).order_by('-pub_date', '-pk'))
+        for state in ('cold', 'warm'):
+            with self.subTest(cache=state):
+                pages = self.pages()
+                self.assertEqual([len(page) for page in pages],
+                                 [POSTS_PER_PAGE, NEXT_PAGE_POSTS])
+                self.assertEqual(sum(pages, []), expected)
+
+    def test_new_post_resets_author_cache(self):
+        self.pages()
+        with run_on_commit():
+            post = Post.objects.create(
+                author=self.authors[3], text='Новый пост')
+        page_obj = self.client.get(
+            reverse('posts:follow_index')).context['page_obj']
+        self.assertEqual(page_obj[0], post)
+
+    @override_settings(FEED_MERGE_RECENT=20)
+    def test_warm_page_skips_author_seeks(self):
+        url = reverse('posts:follow_index')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse(any(
+            f'FROM {Post._meta.db_table} WHERE author_id' in query['sql']
+            for query in queries))
+
+
+class TrendingViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.posts = [Post.objects.create(author=cls.author, text=f'Пост {i}')
+                     for i in range(TRENDING_POSTS)]
+
+    def setUp(self):
+        self.client = Client()
+
+    def comment(self, post, amount=1):
+        for _ in range(amount):
+            Comment.objects.create(post=post, author=self.author, text='Да')
+
+    def page(self, **params):
+        return self.client.get(reverse('posts:trending'), params)
+
+    def test_most_commented_first(self):
+        self.comment(self.posts[3], 3)
+        self.comment(self.posts[5], 2)
+        self.comment(self.posts[1])
+        self.assertEqual(list(self.page().context['page_obj']),
+                         [self.posts[3], self.posts[5], self.posts[1]])
+
+    def test_decay_depends_on_window(self):
+        now = timezone.now()
+        old, fresh = self.posts[:2]
+        for _ in range(3):
+            trending.record(old.pk, now - timedelta(hours=3))
+        trending.record(fresh.pk, now)
+        self.assertEqual(
+            list(self.page(window='hour').context['page_obj']), [fresh, old])
+        self.assertEqual(
+            list(self.page(window='week').context['page_obj']), [old, fresh])
+        self.assertEqual(self.page(window='year').context['window'],
+                         trending.DEFAULT_WINDOW)
+
+    def test_keyset_pages(self):
+        for amount, post in enumerate(self.posts, start=1):
+            self.comment(post, amount)
+        first = self.page(window='week').context['page_obj']
+        self.assertEqual(len(first), POSTS_PER_PAGE)
+        self.assertEqual(first[0], self.posts[-1])
+        second = self.page(window='week',
+                           cursor=first.next_cursor).context['page_obj']
+        self.assertEqual(len(second), TRENDING_POSTS - POSTS_PER_PAGE)
+        self.assertFalse(second.has_next())
+        self.assertEqual(list(first) + list(second), self.posts[::-1])
+        self.assertContains(self.page(window='week'),
+                            f'window=week&cursor={first.next_cursor}')
+
+    @override_settings(TRENDING_TOP_K=TRENDING_TOP_K)
+    def test_top_k_per_window(self):
+        for amount, post in enumerate(self.posts, start=1):
+            self.comment(post, amount)
+        for window in trending.HALF_LIVES:
+            self.assertEqual(
+                set(TrendingScore.objects.filter(window=window)
+                    .values_list('post', flat=True)),
+                {post.pk for post in self.posts[-TRENDING_TOP_K:]})
+
+    def test_rebuild_matches_incremental(self):
+        for amount, post in enumerate(self.posts[:5], start=1):
+            self.comment(post, amount)
+        incremental = {
+            (post, window): score for post, window, score in
+            TrendingScore.objects.values_list('post', 'window', 'score')}
+        call_command('rebuild_trending', stdout=StringIO())
+        rebuilt = TrendingScore.objects.values_list('post', 'window', 'score')
+        self.assertEqual(len(rebuilt), len(incremental))
+        for post, window, score in rebuilt:
+            self.assertAlmostEqual(score, incremental[post, window])
+
+    def test_deleted_post_leaves_feed(self):
+        post = Post.objects.create(author=self.author, text='Удалённый')
+        self.comment(post)
+        post.delete()
+        self.assertFalse(TrendingScore.objects.exists())
@@ -0,0 +1,107 @@
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import connections, transaction
+from sorl.thumbnail import get_thumbnail
+
+from core import writes
+
+from .feed_cache import bump_feed_generation
+from .images import build_variants, delete_variants
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _init_worker():
+    django.setup()
+    # соединения родителя нельзя использовать в другом процессе
+    connections.close_all()
+
+
+def generate_thumbnails(name):
+    """Создаёт миниатюры всех размеров из THUMBNAIL_GEOMETRIES.
+
+    После этого тег {% thumbnail %} в шаблоне только читает
+    метаданные из kvstore sorl-thumbnail.
+    """
+    for geometry, options in settings.THUMBNAIL_GEOMETRIES:
+        try:
+            get_thumbnail(name, geometry, **options)
+        except Exception:
+            logger.exception('Не удалось создать миниатюру %s', name)
+
+
+def process_image(post_id, name):
+    """Миниатюры и варианты картинки; выполняется в пуле процессов."""
+    generate_thumbnails(name)
+    try:
+        return build_variants(name, post_id)
+    except Exception:
+        logger.exception('Не удалось нарезать картинку %s', name)
+        return None
+
+
+def store_variants(post_id, variants):
+    """Сохраняет метаданные вариантов в родительском процессе,
+    где живёт кеш, который нужно сбросить."""
+    if variants is None:
+        return
+    if not variants:
+        # картинку убрали из поста
+        delete_variants(post_id)
+    Post.objects.filter(pk=post_id).update(
+        image_variants=json.dumps(variants) if variants else '')
+    bump_feed_generation()
+
+
+def _store_result(post_id, future):
+    """Колбэк future: выполняется в служебном потоке пула процессов."""
+    if future.exception() is not None:
+        logger.error('Обработка картинки поста %s упала: %s',
+                     post_id, future.exception())
+        return
+    try:
+        writes.with_retries('posts.thumbnails.store_variants',
+                            store_variants, post_id, future.result())
+    finally:
+        # соединение этого потока больше никто не закроет
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            initializer=_init_worker,
+        )
+    return _executor
+
+
+def _submit(post_id, name):
+    future = _get_executor().submit(process_image, post_id, name)
+    future.add_done_callback(
+        lambda future: _store_result(post_id, future))
+
+
+def schedule_thumbnails(post):
+    """Ставит обработку картинки поста в пул процессов после коммита.
+
+    При THUMBNAIL_WORKERS = 0 картинка обрабатывается в текущем процессе.
+    """
+    if not post.image:
+        if post.image_variants:
+            store_variants(post.pk, [])
+        return
+    post_id, name = post.pk, post.image.name
+    if not settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(
+            lambda: store_variants(post_id, process_image(post_id, name)))
+        return
+    transaction.on_commit(lambda: _submit(post_id, name))
@@ -0,0 +1,275 @@
+"""Материализованная лента подписок (push-модель).
+
+Новый пост раскладывается в TimelineEntry каждого подписчика вместе
+с копией pub_date, и лента читается поиском по индексу
+(user, -pub_date, -post). Посты авторов в режиме pull не
+раскладываются: они читаются при показе ленты поиском по индексу
+(author, -pub_date) и сливаются с записями.
+
+Режим хранится в AuthorStats.timeline_mode, и запись на пути запроса
+его только читает. Переключает режимы команда rebalance_timelines:
+автор с числом подписчиков больше fanout_limit() уходит в pull, а
+возвращается в push, только когда их стало не больше
+fanout_return_limit(). Между порогами режим не меняется, поэтому
+автор у порога не вызывает полную очистку или заполнение лент на
+каждую подписку и отписку. Ленты очищаются и заполняются пачками
+подписчиков, каждая в своей короткой транзакции записи.
+"""
+import heapq
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from core import writes
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .paginator import (AMOUNT_OF_POSTS, CountedPaginator, CursorPage,
+                        decode_cursor, encode_key)
+from .seek import seek_many
+
+BATCH_SIZE: int = 500
+
+
+def fanout_limit():
+    """Число подписчиков, после которого автор уходит в pull."""
+    return getattr(settings, 'TIMELINE_FANOUT_MAX_FOLLOWERS', 10000)
+
+
+def fanout_return_limit():
+    """Число подписчиков, при котором автор возвращается в push."""
+    return getattr(settings, 'TIMELINE_FANOUT_RETURN_FOLLOWERS',
+                   fanout_limit() * 9 // 10)
+
+
+def is_pull_author(author_id):
+    return AuthorStats.objects.filter(
+        author_id=author_id, timeline_mode=AuthorStats.PULL).exists()
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_pull_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    with transaction.atomic():
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+             for user_id in followers.iterator()),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика уже опубликованные посты автора."""
+    backfill_many(user_id, (author_id,))
+
+
+def backfill_many(user_id, author_ids):
+    """backfill сразу для многих авторов: авторы в pull отсеиваются
+    одним запросом, посты остальных вставляются одной пачкой."""
+    pulled = set(AuthorStats.objects.filter(
+        author_id__in=author_ids, timeline_mode=AuthorStats.PULL,
+    ).values_list('author_id', flat=True))
+    pushed = [pk for pk in author_ids if pk not in pulled]
+    if not pushed:
+        return
+    posts = Post.objects.filter(author_id__in=pushed).order_by().values_list(
+        'pk', 'pub_date')
+    with transaction.atomic():
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=date)
+             for post_id, date in posts.iterator()),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def trim(user_id, author_id):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    trim_many(user_id, (author_id,))
+
+
+def trim_many(user_id, author_ids):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id__in=author_ids).delete()
+
+
+def _followers(author_id):
+    """id подписчиков автора пачками по BATCH_SIZE."""
+    followers = Follow.objects.filter(author_id=author_id).order_by(
+        'user_id').values_list('user_id', flat=True)
+    last = 0
+    while True:
+        batch = list(followers.filter(user_id__gt=last)[:BATCH_SIZE])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+
+def _set_mode(author_id, mode):
+    AuthorStats.objects.filter(author_id=author_id).update(
+        timeline_mode=mode)
+
+
+def _purge(author_id, user_ids):
+    TimelineEntry.objects.filter(
+        user_id__in=user_ids, post__author_id=author_id).delete()
+
+
+def _fill(author_id, user_ids):
+    """Раскладывает все посты автора по лентам части подписчиков
+    одним INSERT ... SELECT."""
+    connection = connections[router.db_for_write(TimelineEntry)]
+    ops = connection.ops
+    follow = Follow._meta
+    post = Post._meta
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{ops.insert_statement(ignore_conflicts=True)} '
+            f'{TimelineEntry._meta.db_table} (user_id, post_id, pub_date) '
+            f'SELECT f.user_id, p.id, p.pub_date FROM {follow.db_table} f '
+            f'JOIN {post.db_table} p ON p.author_id = f.author_id '
+            f'WHERE f.author_id = %s AND f.user_id IN ({placeholders}) '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}',
+            [author_id, *user_ids])
+
+
+def _to_pull(author_id):
+    """Сначала режим, потом очистка: пока записи удаляются, лента
+    читает посты автора напрямую и убирает повторы."""
+    label = 'posts.timeline.to_pull'
+    writes.with_retries(label, _set_mode, author_id, AuthorStats.PULL)
+    for user_ids in _followers(author_id):
+        writes.with_retries(label, _purge, author_id, user_ids)
+
+
+def _to_push(author_id):
+    """В режиме fill новые посты и подписки уже раскладываются, а лента
+    ещё читает автора напрямую; записи, появившиеся до этого,
+    дозаполняются пачками, и только потом автор читается из записей."""
+    label = 'posts.timeline.to_push'
+    writes.with_retries(label, _set_mode, author_id, AuthorStats.FILL)
+    for user_ids in _followers(author_id):
+        writes.with_retries(label, _fill, author_id, user_ids)
+    writes.with_retries(label, _set_mode, author_id, AuthorStats.PUSH)
+
+
+def rebalance():
+    """Переключает режимы авторов, чьё число подписчиков вышло за
+    пороги. Возвращает число ушедших в pull и вернувшихся в push.
+
+    Прерванное переключение продолжится при следующем запуске: автор
+    остаётся в pull или в fill.
+    """
+    stats = AuthorStats.objects.order_by('author_id')
+    to_pull = list(stats.filter(
+        followers_count__gt=fanout_limit(),
+    ).exclude(timeline_mode=AuthorStats.PULL).values_list(
+        'author_id', flat=True))
+    to_push = list(stats.filter(
+        Q(timeline_mode=AuthorStats.PULL,
+          followers_count__lte=fanout_return_limit())
+        | Q(timeline_mode=AuthorStats.FILL,
+            followers_count__lte=fanout_limit()),
+    ).values_list('author_id', flat=True))
+    for author_id in to_pull:
+        _to_pull(author_id)
+    for author_id in to_push:
+        _to_push(author_id)
+    return len(to_pull), len(to_push)
+
+
+class Timeline:
+    """Лента подписок пользователя: записи TimelineEntry, слитые
+    с постами авторов в pull-режиме.
+
+    Срез отдаёт посты, count() — их число из записей и счётчиков
+    авторов, поэтому ленту можно передать в Paginator, а
+    WindowedPaginator считает её через count(limit). after() —
+    страница по курсору, она читает не больше per_page + 1 ключей
+    из каждого источника.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def pulled(self):
+        """{id автора: число постов} для авторов в pull-режиме."""
+        return dict(
+            Follow.objects.filter(
+                user_id=self.user.pk,
+                author__stats__timeline_mode__in=(
+                    AuthorStats.PULL, AuthorStats.FILL),
+            ).values_list('author_id', 'author__stats__posts_count'))
+
+    def count(self, limit=None):
+        """Число постов ленты; с limit — не больше limit, по одним
+        ключам, без чтения самих постов."""
+        if limit is not None:
+            return len(self.keys(None, limit))
+        return (TimelineEntry.objects.filter(user_id=self.user.pk).count()
+                + sum(self.pulled.values()))
+
+    def __len__(self):
+        return self.count()
+
+    def keys(self, after, limit):
+        """До limit ключей (pub_date, id) постов ленты старше after."""
+        entries = TimelineEntry.objects.filter(user_id=self.user.pk)
+        if after is not None:
+            date, pk = after
+            entries = entries.filter(
+                Q(pub_date__lt=date) | Q(pub_date=date, post_id__lt=pk))
+        streams = [list(entries.order_by('-pub_date', '-post_id')
+                        .values_list('pub_date', 'post_id')[:limit])]
+        if self.pulled:
+            streams += seek_many(list(self.pulled), after, limit).values()
+        # пока rebalance_timelines переключает автора, его посты есть
+        # и в записях, и в потоке автора
+        merged = (key for key, _ in groupby(
+            heapq.merge(*streams, reverse=True)))
+        return list(islice(merged, limit))
+
+    def _posts(self, keys):
+        posts = Post.objects.feed_cards().in_bulk([pk for _, pk in keys])
+        # пост могли удалить между чтением ключа и постов
+        return [posts[pk] for _, pk in keys if pk in posts]
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step:
+            raise TypeError('Timeline поддерживает только срезы')
+        start, stop = index.start or 0, index.stop
+        return self._posts(self.keys(None, stop)[start:])
+
+    def after(self, cursor, per_page=AMOUNT_OF_POSTS):
+        """Страница ленты после курсора `cursor`."""
+        after = decode_cursor(cursor) if cursor else None
+        keys = self.keys(after, per_page + 1)
+        has_next = len(keys) > per_page
+        keys = keys[:per_page]
+        return CursorPage(
+            self._posts(keys),
+            next_cursor=(encode_key(keys[-1][0].isoformat(), keys[-1][1])
+                         if has_next else None),
+        )
+
+
+def timeline_page(request, user, per_page=AMOUNT_OF_POSTS):
+    """Страница ленты подписок: по курсору `cursor` или по номеру,
+    как posts.paginator.paginate."""
+    timeline = Timeline(user)
+    cursor = request.GET.get('cursor')
+    if cursor or getattr(settings, 'POSTS_CURSOR_PAGINATION', False):
+        return timeline.after(cursor, per_page)
+    paginator = CountedPaginator(
+        timeline, per_page,
+        max_pages=getattr(settings, 'POSTS_MAX_PAGES', None))
+    return paginator.get_page(request.GET.get('page'))
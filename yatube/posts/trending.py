@@ -0,0 +1,145 @@
+"""Лента «Обсуждаемое»: посты по затухающей активности комментариев.
+
+Вес комментария убывает вдвое за период полураспада окна (час, день,
+неделя). Чтобы не пересчитывать веса со временем, хранится
+log Σ 2^((tᵢ − EPOCH) / T): у всех постов окна он отличается от
+текущей оценки на одно и то же слагаемое, поэтому порядок тот же,
+а новый комментарий лишь прибавляется к сумме. Логарифм нужен, чтобы
+степени двойки не переполнили float.
+
+В каждом окне хранится не больше TRENDING_TOP_K постов, как в
+алгоритме Space-Saving: новый пост при полном окне вытесняет пост
+с наименьшей оценкой и наследует её. Так активно обсуждаемый пост
+обязательно попадёт в окно, а его оценка завышена не больше чем на
+оценку вытесненного. Страница ленты — поиск по индексу
+(window, -score, -post) после курсора и in_bulk постов, то есть два
+запроса при любом числе комментариев.
+"""
+import heapq
+import math
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Comment, Post, TrendingScore
+from .paginator import AMOUNT_OF_POSTS, CursorPage, decode_key, encode_key
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+HALF_LIVES = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+DEFAULT_WINDOW = 'day'
+# За сколько периодов полураспада недели rebuild читает комментарии:
+# вклад более старых меньше 2⁻¹⁰.
+REBUILD_HALF_LIVES = 10
+BATCH_SIZE: int = 500
+
+
+def _log_weight(when, window, weight=1):
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return ((when - EPOCH) / HALF_LIVES[window] * math.log(2)
+            + math.log(weight))
+
+
+def _log_add(a, b):
+    """log(eᵃ + eᵇ) без переполнения."""
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _admit(post_id, window, value):
+    """Новая строка окна; при полном окне вытесняет посты с наименьшей
+    оценкой, и новый пост получает оценку последнего из них."""
+    rows = TrendingScore.objects.filter(window=window)
+    excess = rows.count() - settings.TRENDING_TOP_K + 1
+    if excess > 0:
+        evicted = list(rows.order_by('score', 'post_id').values_list(
+            'pk', 'score')[:excess])
+        TrendingScore.objects.filter(
+            pk__in=[pk for pk, _ in evicted]).delete()
+        value = _log_add(evicted[-1][1], value)
+    return TrendingScore(post_id=post_id, window=window, score=value)
+
+
+def record(post_id, when, weight=1):
+    """Прибавляет к оценкам поста во всех окнах событие веса weight,
+    случившееся в момент when.
+
+    Вызывать внутри транзакции записи (как сохранение комментария):
+    чтение оценки и её запись не должны разойтись с параллельной.
+    """
+    scores = dict(TrendingScore.objects.filter(post_id=post_id)
+                  .values_list('window', 'score'))
+    new = []
+    for window in HALF_LIVES:
+        value = _log_weight(when, window, weight)
+        if window in scores:
+            TrendingScore.objects.filter(
+                post_id=post_id, window=window,
+            ).update(score=_log_add(scores[window], value))
+        else:
+            new.append(_admit(post_id, window, value))
+    TrendingScore.objects.bulk_create(new)
+
+
+def rebuild(now=None):
+    """Заново считает оценки по недавним комментариям; для начального
+    заполнения и после массовой загрузки в обход сигналов. Возвращает
+    число сохранённых строк."""
+    since = (now or timezone.now()) - (
+        REBUILD_HALF_LIVES * max(HALF_LIVES.values()))
+    scores = {window: {} for window in HALF_LIVES}
+    comments = Comment.objects.filter(created__gte=since).order_by(
+    ).values_list('post_id', 'created')
+    for post_id, created in comments.iterator(chunk_size=BATCH_SIZE):
+        for window, window_scores in scores.items():
+            value = _log_weight(created, window)
+            old = window_scores.get(post_id)
+            window_scores[post_id] = (
+                value if old is None else _log_add(old, value))
+    TrendingScore.objects.all().delete()
+    saved = 0
+    for window, window_scores in scores.items():
+        top = heapq.nlargest(
+            settings.TRENDING_TOP_K, window_scores.items(),
+            key=lambda item: (item[1], item[0]))
+        TrendingScore.objects.bulk_create(
+            (TrendingScore(post_id=post_id, window=window, score=score)
+             for post_id, score in top),
+            batch_size=BATCH_SIZE)
+        saved += len(top)
+    return saved
+
+
+def _decode(cursor):
+    values = decode_key(cursor, 2)
+    if values is None:
+        return None
+    try:
+        return float(values[0]), int(values[1])
+    except ValueError:
+        return None
+
+
+def trending_page(window=DEFAULT_WINDOW, cursor=None,
+                  per_page=AMOUNT_OF_POSTS):
+    """Страница ленты «Обсуждаемое» окна window после курсора."""
+    rows = TrendingScore.objects.filter(window=window)
+    after = _decode(cursor) if cursor else None
+    if after is not None:
+        score, pk = after
+        rows = rows.filter(Q(score__lt=score) | Q(score=score, post_id__lt=pk))
+    rows = list(rows.order_by('-score', '-post_id').values_list(
+        'score', 'post_id')[:per_page + 1])
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = Post.objects.feed_cards().in_bulk([pk for _, pk in rows])
+    return CursorPage(
+        [posts[pk] for _, pk in rows if pk in posts],
+        next_cursor=encode_key(*rows[-1]) if has_next else None,
+    )
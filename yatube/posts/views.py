@@ -1,45 +1,71 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import condition, require_POST
 
+from core import writes
+
+from . import conditional, follow_graph
+from .feed_cache import feed_cache_context
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .merge_feed import merged_page
+from .models import Comment, Group, Post, TrendingScore, User
+from .paginator import AMOUNT_OF_COMMENTS, CursorPaginator, paginate
+from .search import search_page
+from .stats import get_stats
+from .suggestions import suggested_authors
+from .thumbnails import schedule_thumbnails
+from .timeline import timeline_page
+from .trending import DEFAULT_WINDOW, HALF_LIVES, trending_page
 
-AMOUNT_OF_POSTS: int = 10
+# Сколько авторов можно передать в profile_follow_many за раз.
+BULK_FOLLOW_LIMIT: int = 200
 
 
-# @cache_page(60 * 20)
+@condition(etag_func=conditional.index_etag)
 def index(request):
-    post_list = Post.objects.order_by('-pub_date')
-    paginator = Paginator(post_list, AMOUNT_OF_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.objects.feed_cards().order_by('-pub_date')
+    page_obj = paginate(request, post_list)
     context = {
         'page_obj': page_obj,
+        **feed_cache_context(request, 'index'),
     }
     return render(request, 'posts/index.html', context)
 
 
+def trending(request):
+    """Посты, которые сейчас активнее всего обсуждают, за окно
+    ?window= (час, день или неделя)."""
+    window = request.GET.get('window')
+    if window not in HALF_LIVES:
+        window = DEFAULT_WINDOW
+    context = {
+        'page_obj': trending_page(window, request.GET.get('cursor')),
+        'window': window,
+        'windows': TrendingScore.WINDOWS,
+    }
+    return render(request, 'posts/trending.html', context)
+
+
+@condition(etag_func=conditional.group_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.order_by('-pub_date')
-    paginator = Paginator(post_list, AMOUNT_OF_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.objects.feed_cards().order_by('-pub_date')
+    page_obj = paginate(request, post_list)
     context = {
         'group': group,
         'page_obj': page_obj,
+        **feed_cache_context(request, 'group', group.pk),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@condition(etag_func=conditional.profile_etag)
 def profile(request, username):
     propose_author = get_object_or_404(User, username=username)
-    post_list = propose_author.posts.all()
-    paginator = Paginator(post_list, AMOUNT_OF_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    posts_count = post_list.count()
+    post_list = propose_author.posts.feed_cards()
+    page_obj = paginate(request, post_list)
+    author_stats = get_stats(propose_author)
     # print(Follow.objects.filter(user=request.user).filter(author=propose_author))
     # if Follow.objects.filter(user=request.user).filter(
     #         author=propose_author).exists():
@@ -51,35 +77,87 @@ def profile(request, username):
         'page_obj': page_obj,
         'username': username,
         'author': propose_author,
-        'posts_count': posts_count,
+        'posts_count': author_stats.posts_count,
+        'followers_count': author_stats.followers_count,
+        'following_count': author_stats.following_count,
         'following': following,
+        'suggestions': suggested_authors(
+            request.user, exclude=(propose_author.pk,)),
+        **feed_cache_context(request, 'profile', propose_author.pk),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@condition(etag_func=conditional.post_etag)
 def post_detail(request, post_id):
-    propose_post = get_object_or_404(Post, pk=post_id)
+    propose_post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id)
     propose_author = propose_post.author
-    posts_count = propose_author.posts.count()
+    posts_count = get_stats(propose_author).posts_count
     form = CommentForm()
-    comments = propose_post.comments.all()
     context = {
         'post': propose_post,
         'author': propose_author,
         'posts_count': posts_count,
         'form': form,
-        'comments': comments,
+        'comments': comments_page(request, propose_post.pk),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comments_page(request, post_id):
+    """Страница комментариев поста по ключу (created, id)."""
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author').only('text', 'created', 'author__username')
+    return CursorPaginator(
+        comments, AMOUNT_OF_COMMENTS, field='created',
+    ).get_page(request.GET.get('cursor'))
+
+
+def post_comments(request, post_id):
+    """HTML-фрагмент со следующей страницей комментариев."""
+    context = {
+        'post_id': post_id,
+        'comments': comments_page(request, post_id),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = search_page(query, request.GET.get('cursor'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def save_post(label, post):
+    """Сохраняет пост записью с повторами (core.writes.run).
+
+    Новый файл картинки сохраняется до записи и один раз: повтор
+    после блокировки иначе сохранял бы его заново, оставляя в MEDIA
+    прежние копии.
+    """
+    image = post.image
+    if image and not image._committed:
+        image.save(image.name, image.file, save=False)
+
+    def save():
+        post.save()
+        schedule_thumbnails(post)
+
+    writes.run(label, save)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        save_post('posts.views.post_create', post)
         return redirect('posts:profile', username=post.author.username)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -94,7 +172,7 @@ def post_edit(request, post_id):
                     files=request.FILES or None,
                     instance=post)
     if form.is_valid():
-        post.save()
+        save_post('posts.views.post_edit', post)
         return redirect('posts:post_detail', post_id)
     return render(request, 'posts/create_post.html',
                   {'form': form,
@@ -112,40 +190,57 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        writes.run('posts.views.add_comment', comment.save)
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@condition(etag_func=conditional.follow_etag)
 def follow_index(request):
-    print('VELEL')
-    print(request.user)
-    post_list = Post.objects.filter(
-        author__following__user=request.user).order_by('-pub_date')
-    paginator = Paginator(post_list, AMOUNT_OF_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if settings.FOLLOW_FEED_ENGINE == 'merge':
+        page_obj = merged_page(request.user, request.GET.get('cursor'))
+    else:
+        page_obj = timeline_page(request, request.user)
     context = {
         'page_obj': page_obj,
+        'suggestions': suggested_authors(request.user),
+        **feed_cache_context(request, 'follow', request.user.pk),
     }
     return render(request, 'posts/follow.html', context)
 
 
 def is_subscribed(user, author):
-    if user.is_authenticated:
-        return Follow.objects.filter(user=user, author=author).exists()
+    return follow_graph.is_following(user, author.pk)
 
 
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    if request.user != author and not is_subscribed(request.user, author):
-        Follow.objects.create(user=request.user, author=author)
+    writes.run('posts.views.profile_follow', follow_graph.follow,
+               request.user, (author.pk,))
     return redirect('posts:profile', username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=author).delete()
+    writes.run('posts.views.profile_unfollow', follow_graph.unfollow,
+               request.user, (author.pk,))
     return redirect('posts:profile', username)
+
+
+@login_required
+@require_POST
+def profile_follow_many(request):
+    """Подписка или отписка (action=unfollow) сразу на всех авторов
+    из списка username одной транзакцией."""
+    usernames = request.POST.getlist('username')[:BULK_FOLLOW_LIMIT]
+    author_ids = list(User.objects.filter(
+        username__in=usernames).values_list('pk', flat=True))
+    if request.POST.get('action') == 'unfollow':
+        writes.run('posts.views.profile_follow_many', follow_graph.unfollow,
+                   request.user, author_ids)
+    else:
+        writes.run('posts.views.profile_follow_many', follow_graph.follow,
+                   request.user, author_ids)
+    return redirect('posts:follow_index')
@@ -36,6 +36,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.routers.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -62,13 +63,30 @@ TEMPLATES = [
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
+# SQLite в режиме WAL (см. core.backends.sqlite3); соединение живёт
+# в потоке воркера между запросами.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
     }
 }
 
+# Реплика только для чтения: второй файл SQLite, который обновляет
+# команда refresh_replica. Без YATUBE_REPLICA_DB всё читается из default.
+REPLICA_DATABASE = os.environ.get('YATUBE_REPLICA_DB')
+if REPLICA_DATABASE:
+    DATABASES['replica'] = {
+        'ENGINE': 'core.backends.sqlite3',
+        'NAME': REPLICA_DATABASE,
+        'CONN_MAX_AGE': 600,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_NAMESPACES = ('posts', 'users', 'about')
+REPLICA_STICKY_SECONDS = 10
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -111,8 +129,72 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Сколько страниц ленты доступно по номеру; None — без ограничения.
+# Дальние страницы открываются курсорной пагинацией (?cursor=).
+POSTS_MAX_PAGES = None
+
+# Поиск по постам: FTS5 в SQLite, для других баз — posts.search.LikeBackend.
+POSTS_SEARCH_BACKEND = 'posts.search.FTS5Backend'
+
+# Миниатюры, которые создаются сразу после сохранения поста;
+# должны совпадать с тегами {% thumbnail %} в шаблонах лент.
+THUMBNAIL_GEOMETRIES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+THUMBNAIL_WORKERS = 2
+
+# Адаптивные варианты картинок поста для srcset, от лучшего формата
+# к запасному; недоступные в сборке Pillow форматы пропускаются.
+IMAGE_VARIANT_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+IMAGE_VARIANT_WIDTHS = (480, 960, 1440)
+IMAGE_VARIANT_RATIO = (960, 339)
+
+# Общий для всех воркеров на хосте кеш в файле SQLite (см. core.cache).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'default.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
+
+# Тесты работают со своим временным файлом кеша (core.test_runner).
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+# Фрагменты лент сбрасываются при записи постов через поколение ключа,
+# поэтому их можно хранить долго.
+FEED_CACHE_TIMEOUT = 60 * 60 * 3
+
+# Авторы с большим числом подписчиков не раскладываются по лентам
+# при публикации, их посты читаются в ленту подписок напрямую.
+# Режим переключает команда rebalance_timelines; к раскладке автор
+# возвращается, когда подписчиков не больше
+# TIMELINE_FANOUT_RETURN_FOLLOWERS.
+TIMELINE_FANOUT_MAX_FOLLOWERS = 10000
+TIMELINE_FANOUT_RETURN_FOLLOWERS = 9000
+
+# Как строится лента подписок: 'timeline' — из разложенных при записи
+# постов, 'merge' — слиянием недавних постов авторов при чтении
+# (posts.merge_feed). FEED_MERGE_RECENT — сколько новейших постов
+# автора хранится в кеше и читается за один поиск по индексу.
+FOLLOW_FEED_ENGINE = 'timeline'
+FEED_MERGE_RECENT = 20
+
+# Сколько рекомендованных авторов хранит для пользователя команда
+# recommend_authors.
+SUGGESTIONS_STORED = 20
+
+# Сколько постов хранит каждое окно ленты «Обсуждаемое»
+# (posts.trending); страницы дальше не листаются.
+TRENDING_TOP_K = 500
+
+# Запись в SQLite (core.writes): повторы при «database is locked»
+# и необязательный поток-писатель с групповым коммитом.
+WRITE_RETRIES = 5
+WRITE_RETRY_DELAY = 0.02
+WRITE_QUEUE = False
+WRITE_QUEUE_BATCH = 50
+WRITE_QUEUE_WAIT = 0.002
+WRITE_METRICS_FLUSH = 5